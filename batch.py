@@ -0,0 +1,26 @@
+import argparse
+import logging
+
+from formulations.batch import FORMULATIONS, run_batch
+from formulations.solvers import SOLVERS
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Factorize a file or a directory of semiprimes over a process pool")
+    parser.add_argument("path", help="A file or a directory of semiprimes, one per line")
+    parser.add_argument("--output", default="output/batch.jsonl", help="The JSONL file of the results")
+    parser.add_argument("--formulation", default="direct", choices=list(FORMULATIONS))
+    parser.add_argument("--solver", default="sa", choices=list(SOLVERS))
+    parser.add_argument("--num-reads", type=int, default=1000)
+    parser.add_argument("--qpu", default="dwave", choices=["dwave", "mock"], help="The QPU of the qa solver")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--store", default=None, help="The directory of a result store, instead of per-run files")
+    parser.add_argument("--classical-budget", type=float, default=0.01,
+                        help="The seconds of classical factoring before annealing each semiprime")
+    parser.add_argument("--anneal-only", action="store_true", help="Skip the classical factoring")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format="%(message)s")
+    run_batch(args.path, output=args.output, formulation=args.formulation, solver=args.solver,
+              num_reads=args.num_reads, workers=args.workers, result_store=args.store,
+              classical_budget=None if args.anneal_only else args.classical_budget, qpu=args.qpu)
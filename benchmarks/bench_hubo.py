@@ -0,0 +1,84 @@
+"""
+Benchmark of the (n - pq)^2 HUBO construction against the bit length of n.
+Compares the array-backed DirectFormulation.build_hubo with the former nested-loop expansion, and asserts that
+both build the same polynomial.
+Usage: python -m benchmarks.bench_hubo [max_bits]
+"""
+import random
+import sys
+import time
+from math import log
+
+from formulations import DirectFormulation
+from formulations.classical import random_semiprime
+
+
+def legacy_hubo(n):
+    """
+    The nested-loop expansion that DirectFormulation.solve used before build_hubo
+    """
+    l = int(log(n, 2)) // 2 + 1
+    var_map = {}
+    for i in range(0, l * 2):
+        if i == 0 or i == l:
+            continue
+        var_map[("x", i)] = len(var_map)
+    pq_terms = {}
+    pq_offset = 0
+    for i in range(0, l):
+        for j in range(0, l):
+            if i == 0 and j == 0:
+                pq_offset += 1
+            elif i == 0:
+                pq_terms[(var_map[("x", j + l)],)] = pow(2, i + j)
+            elif j == 0:
+                pq_terms[(var_map[("x", i)],)] = pow(2, i + j)
+            else:
+                pq_terms[(var_map[("x", i)], var_map[("x", j + l)])] = pow(2, i + j)
+    hubo_terms = {}
+    pq_terms[()] = pq_offset - n
+    for term1 in pq_terms.keys():
+        for term2 in pq_terms.keys():
+            var_tuple = tuple(set(list(term1) + list(term2)))
+            hubo_terms[var_tuple] = hubo_terms.get(var_tuple, 0) + pq_terms[term1] * pq_terms[term2]
+    return hubo_terms
+
+
+def assert_same_hubo(n, legacy, hubo):
+    """
+    Check that the legacy terms equal the PolyArray. The legacy keys are unordered tuples of a set, so the terms
+    over the same variables are summed under their sorted key.
+    :param n: The semiprime of both polynomials
+    :param legacy: The dict of legacy_hubo(n), with the offset keyed by ()
+    :param hubo: The PolyArray of DirectFormulation.build_hubo(n)
+    """
+    terms = {}
+    for key, coef in legacy.items():
+        key = tuple(sorted(key))
+        terms[key] = terms.get(key, 0) + coef
+    offset = terms.pop((), 0)
+    assert offset == hubo.offset, "offset of {} differs: {} != {}".format(n, offset, hubo.offset)
+    assert terms == hubo.to_dict(), "terms of {} differ from legacy_hubo".format(n)
+
+
+def main(max_bits=48):
+    rng = random.Random(0)
+    print("{:>5} {:>9} {:>11} {:>11} {:>11}".format("bits", "terms", "legacy (s)", "arrays (s)", "to_dict (s)"))
+    for bits in range(8, max_bits + 1, 4):
+        n = random_semiprime(bits, rng)
+        start = time.perf_counter()
+        legacy = legacy_hubo(n)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hubo = DirectFormulation().build_hubo(n)
+        array_time = time.perf_counter() - start
+        start = time.perf_counter()
+        hubo.to_dict()
+        dict_time = time.perf_counter() - start
+        assert_same_hubo(n, legacy, hubo)
+        print("{:>5} {:>9} {:>11.4f} {:>11.4f} {:>11.4f}".format(bits, len(hubo), legacy_time, array_time, dict_time))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 48)
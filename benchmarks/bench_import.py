@@ -0,0 +1,87 @@
+"""
+Time the startup of the package in fresh interpreters, as the short-lived processes of a batch see it:
+the import of formulations, the lookup of a solver and the --help of the command line.
+Also checks that the heavy dependencies and solver modules are only imported by the backends that need them.
+Exits non-zero when a median time is above its limit or a heavy module is imported too early.
+Usage: python -m benchmarks.bench_import [--runs 5] [--max-import 1.0] [--max-cli 1.5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules that are slow to import, or that pull in slow modules, needed by some backends only
+HEAVY_MODULES = ["dwave.system", "dwave.inspector", "dwave.cloud", "dwave.samplers", "minorminer",
+                 "formulations.solvers.solve_bqm", "formulations.solvers.parallel_sa"]
+
+# The statements of each check, with the heavy modules they are allowed to import
+CHECKS = {
+    "import": ("import formulations", []),
+    "solver_sa": ("from formulations.solvers import SOLVERS; SOLVERS['sa']",
+                  ["dwave.samplers", "formulations.solvers.solve_bqm"]),
+    "solver_decomp": ("from formulations.solvers import SOLVERS; SOLVERS['decomp']",
+                      ["dwave.samplers", "formulations.solvers.solve_bqm"]),
+}
+
+
+def loaded_modules(code):
+    """
+    :param code: Python statements run in a fresh interpreter
+    :return: The heavy modules imported by the statements
+    """
+    probe = "{}\nimport json, sys\nprint(json.dumps([m for m in {!r} if m in sys.modules]))".format(code, HEAVY_MODULES)
+    output = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def time_command(args, runs=5):
+    """
+    :param args: The command line of a Python process
+    :param runs: The number of processes timed
+    :return: The median wall time of the processes in seconds
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, capture_output=True, check=True)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of the package")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import", type=float, default=1.0, help="The limit of import formulations in seconds")
+    parser.add_argument("--max-cli", type=float, default=1.5, help="The limit of main.py --help in seconds")
+    args = parser.parse_args()
+
+    failures = []
+    baseline = time_command([sys.executable, "-c", "pass"], runs=args.runs)
+    print("{:>14} {:>9}  {}".format("check", "time (s)", "heavy modules"))
+    print("{:>14} {:>9.3f}".format("interpreter", baseline))
+    for name, (code, allowed) in CHECKS.items():
+        elapsed = time_command([sys.executable, "-c", code], runs=args.runs)
+        heavy = loaded_modules(code)
+        print("{:>14} {:>9.3f}  {}".format(name, elapsed, ", ".join(heavy) or "-"))
+        unexpected = [module for module in heavy if module not in allowed]
+        if unexpected:
+            failures.append("{} imports {}".format(name, ", ".join(unexpected)))
+        if name == "import" and elapsed > args.max_import:
+            failures.append("import formulations takes {:.3f}s > {:.3f}s".format(elapsed, args.max_import))
+
+    if os.path.exists("main.py"):
+        elapsed = time_command([sys.executable, "main.py", "--help"], runs=args.runs)
+        print("{:>14} {:>9.3f}".format("cli_help", elapsed))
+        if elapsed > args.max_cli:
+            failures.append("main.py --help takes {:.3f}s > {:.3f}s".format(elapsed, args.max_cli))
+
+    for message in failures:
+        print("FAIL", message)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+Time every stage of the factoring pipeline against the bit length of n, for each formulation:
+HUBO expansion, quadratization, BQM construction, classical preprocessing, embedding, sampling and decoding.
+Also records the peak memory of building the model, the model sizes and the success rate of the sampler.
+Each stage is timed over several repeats and its median is kept, so single slow runs are not flagged.
+The results are written as JSON and compared against benchmarks/baseline_pipeline.json, flagging the regressions.
+The committed baseline was recorded with --max-bits 40 on a single-CPU machine; timings only compare on similar
+hardware, so record a baseline on the machine that runs the check with --save-baseline.
+Usage: python -m benchmarks.bench_pipeline [--min-bits 8] [--max-bits 64] [--repeats 5] [--embed] [--save-baseline]
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+import numpy as np
+from dwave.samplers import SimulatedAnnealingSampler
+
+from formulations.batch import FORMULATIONS
+from formulations.classical import random_semiprime
+from formulations.solvers import ParallelAnnealingSampler
+from formulations.solvers.embedding_cache import generate_target_graph, source_edgelist
+from formulations.solvers.export_embedding import find_best_embedding
+
+
+STAGES = ["hubo", "quadratization", "bqm", "preprocessing", "embedding", "sampling", "decoding"]
+SAMPLERS = {"sa": SimulatedAnnealingSampler, "psa": ParallelAnnealingSampler}
+
+
+class StageTimer:
+    """
+    Record the wall time of named stages, and optionally their peak traced memory.
+    The garbage collector is paused while a stage is timed, as timeit does, since its pauses land at random.
+    """
+
+    def __init__(self, trace_memory=False) -> None:
+        self.times = {}
+        self.peak_bytes = {}
+        self.trace_memory = trace_memory
+        self._stage = None
+
+    def __call__(self, stage):
+        self._stage = stage
+        return self
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        self._gc_enabled = gc.isenabled()
+        gc.disable()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.times[self._stage] = time.perf_counter() - self._start
+        if self._gc_enabled:
+            gc.enable()
+        if self.trace_memory:
+            self.peak_bytes[self._stage] = tracemalloc.get_traced_memory()[1]
+        return False
+
+
+def build_model(formulation, n, timer):
+    """
+    Run the model stages of DirectFormulation.solve without printing the terms
+    :return: The BQM after preprocessing, the offset of the HUBO and the model sizes
+    """
+    with timer("hubo"):
+        hubo = formulation.build_hubo(n)
+        hubo_terms, hubo_offset = hubo.to_dict(), hubo.offset
+    with timer("quadratization"):
+        qubo_terms, hubo_offset = formulation.reduce_hubo(hubo_terms, hubo_offset)
+    with timer("bqm"):
+        bqm = formulation.to_qubo(qubo_terms).to_bqm()
+    sizes = {
+        "num_hubo_terms": len(hubo_terms),
+        "num_vars": len(bqm.variables),
+        "num_aux": formulation.quadratization.aux_count,
+        "num_quadratic": len(bqm.quadratic),
+        "max_coef": float(formulation.quadratization.max_coef),
+    }
+    with timer("preprocessing"):
+        formulation.fix_variables(n, bqm)
+    sizes["num_vars_fixed"] = len(bqm.variables)
+    return bqm, hubo_offset, sizes
+
+
+def run_case(name, n, num_reads=100, num_sweeps=100, sampler="sa", target=None, num_seeds=4, embed_timeout=30,
+             repeats=5):
+    """
+    Benchmark one formulation on one semiprime
+    :param name: The name of the formulation, see FORMULATIONS
+    :param n: A safe semiprime
+    :param num_reads: The number of samples
+    :param num_sweeps: The number of sweeps of each sample
+    :param sampler: sa or psa
+    :param target: The target edge list to embed into, or None to skip the embedding stage
+    :param num_seeds: The number of minorminer seeds of the embedding stage
+    :param embed_timeout: The timeout of each minorminer attempt in seconds
+    :param repeats: The number of times every stage is timed, the embedding stage aside which runs once
+    :return: A dict of the median and the fastest stage times, the model sizes, the peak memory and the mean
+    success rate
+    """
+    result = {"formulation": name, "bits": n.bit_length(), "n": str(n), "repeats": repeats}
+    times = defaultdict(list)
+    success_rates = []
+    for repeat in range(repeats):
+        timer = StageTimer()
+        formulation = FORMULATIONS[name]()
+        bqm, offset, sizes = build_model(formulation, n, timer)
+        result.update(sizes)
+        if repeat == 0 and target is not None and len(bqm.variables) > 0:
+            with timer("embedding"):
+                embedding = find_best_embedding(source_edgelist(bqm), target, num_seeds=num_seeds,
+                                                timeout=embed_timeout, max_rounds=1)
+            if embedding:
+                chains = [len(chain) for chain in embedding.values()]
+                result.update(num_qubits=sum(chains), max_chain_length=max(chains))
+            else:
+                result.update(num_qubits=None, max_chain_length=None)
+
+        with timer("sampling"):
+            response = SAMPLERS[sampler]().sample(bqm, num_reads=num_reads, num_sweeps=num_sweeps)
+        with timer("decoding"):
+            evaluation = formulation.evaluate_response(response, offset=offset, input_dict={"n": n})
+        occurrences = response.record.num_occurrences
+        success_rates.append(float(occurrences[evaluation["is_answer"]].sum() / occurrences.sum()))
+        for stage, elapsed in timer.times.items():
+            times[stage].append(elapsed)
+    result["success_rate"] = statistics.mean(success_rates)
+
+    # A second, untimed pass of the model stages under tracemalloc
+    memory = StageTimer(trace_memory=True)
+    tracemalloc.start()
+    try:
+        build_model(FORMULATIONS[name](), n, memory)
+    finally:
+        tracemalloc.stop()
+    result["peak_memory_mb"] = max(memory.peak_bytes.values()) / pow(2, 20)
+    result["stages"] = {stage: statistics.median(elapsed) for stage, elapsed in times.items()}
+    result["stages_min"] = {stage: min(elapsed) for stage, elapsed in times.items()}
+    return result
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.01):
+    """
+    Flag the stages whose fastest repeat is slower than the median of the baseline by more than the tolerance,
+    so a stage is only flagged when all of its repeats slowed down, and the cases whose model grew or whose
+    success rate dropped
+    :param results: The results of this run
+    :param baseline: The results of the baseline run
+    :param tolerance: The allowed relative slowdown
+    :param min_seconds: Slowdowns smaller than this are noise
+    :return: A list of messages
+    """
+    reference = {(case["formulation"], case["bits"]): case for case in baseline["results"]}
+    regressions = []
+    for case in results:
+        key = (case["formulation"], case["bits"])
+        if key not in reference:
+            continue
+        base = reference[key]
+        label = "{} {} bits".format(*key)
+        for stage, elapsed in case.get("stages_min", case["stages"]).items():
+            before = base["stages"].get(stage)
+            if before is not None and elapsed - before > max(tolerance * before, min_seconds):
+                regressions.append("{}: {} took {:.4f}s, baseline {:.4f}s".format(label, stage, elapsed, before))
+        for field in ("num_vars", "num_quadratic", "num_vars_fixed"):
+            if case[field] > base[field]:
+                regressions.append("{}: {} grew from {} to {}".format(label, field, base[field], case[field]))
+        if case["success_rate"] < base["success_rate"] - tolerance:
+            regressions.append("{}: success rate dropped from {:.3f} to {:.3f}".format(
+                label, base["success_rate"], case["success_rate"]))
+        if case["peak_memory_mb"] > base["peak_memory_mb"] * (1 + tolerance) + 1:
+            regressions.append("{}: peak memory rose from {:.1f}MB to {:.1f}MB".format(
+                label, base["peak_memory_mb"], case["peak_memory_mb"]))
+    return regressions
+
+
+def machine_info():
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def print_table(results):
+    print("{:>5} {:>8} {:>7} {:>7} ".format("bits", "form", "vars", "fixed") +
+          " ".join("{:>9}".format(stage[:9]) for stage in STAGES) + " {:>8} {:>7}".format("peak MB", "success"))
+    for case in results:
+        times = defaultdict(lambda: float("nan"), case["stages"])
+        print("{:>5} {:>8} {:>7} {:>7} ".format(case["bits"], case["formulation"], case["num_vars"],
+                                                 case["num_vars_fixed"]) +
+              " ".join("{:>9.4f}".format(times[stage]) for stage in STAGES) +
+              " {:>8.1f} {:>7.3f}".format(case["peak_memory_mb"], case["success_rate"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the factoring pipeline")
+    parser.add_argument("--min-bits", type=int, default=8)
+    parser.add_argument("--max-bits", type=int, default=64)
+    parser.add_argument("--step", type=int, default=8)
+    parser.add_argument("--formulations", nargs="+", default=list(FORMULATIONS), choices=list(FORMULATIONS))
+    parser.add_argument("--num-reads", type=int, default=100)
+    parser.add_argument("--num-sweeps", type=int, default=100)
+    parser.add_argument("--sampler", default="sa", choices=list(SAMPLERS))
+    parser.add_argument("--embed", action="store_true", help="Time minorminer on an ideal Pegasus P16 graph")
+    parser.add_argument("--repeats", type=int, default=5, help="The number of timings of each stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="output/bench_pipeline.json")
+    parser.add_argument("--baseline", default="benchmarks/baseline_pipeline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    target = generate_target_graph("pegasus", 16) if args.embed else None
+    results = []
+    for bits in range(args.min_bits, args.max_bits + 1, args.step):
+        n = random_semiprime(bits, rng)
+        for name in args.formulations:
+            results.append(run_case(name, n, num_reads=args.num_reads, num_sweeps=args.num_sweeps,
+                                    sampler=args.sampler, target=target, repeats=args.repeats))
+    print_table(results)
+
+    report = {"machine": machine_info(), "args": vars(args), "results": results}
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=4)
+        print("Baseline saved to", args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline at", args.baseline)
+        return 0
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    if baseline["machine"]["platform"] != report["machine"]["platform"] or \
+            baseline["machine"]["cpu_count"] != report["machine"]["cpu_count"]:
+        print("The baseline was recorded on {} with {} CPUs, timings may not compare".format(
+            baseline["machine"]["platform"], baseline["machine"]["cpu_count"]))
+    regressions = compare(results, baseline, tolerance=args.tolerance)
+    for message in regressions:
+        print("REGRESSION", message)
+    print("{} regressions against {}".format(len(regressions), args.baseline))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,33 @@
+"""
+Compare the quadratization strategies on the DirectFormulation HUBO against the bit length of n.
+Reports the auxiliary variable count, the maximum |coef| of the QUBO and the reduction time.
+Usage: python -m benchmarks.bench_quadratization [max_bits]
+"""
+import random
+import sys
+import time
+
+from formulations import DirectFormulation
+from formulations.classical import random_semiprime
+from formulations.quadratization import QUADRATIZATIONS
+
+
+def main(max_bits=32):
+    rng = random.Random(0)
+    print("{:>5} {:>10} {:>8} {:>12} {:>9}".format("bits", "strategy", "aux", "max |coef|", "time (s)"))
+    for bits in range(8, max_bits + 1, 4):
+        n = random_semiprime(bits, rng)
+        for name in QUADRATIZATIONS:
+            formulation = DirectFormulation(quadratization=name)
+            hubo = formulation.build_hubo(n)
+            hubo_terms = hubo.to_dict()
+            start = time.perf_counter()
+            formulation.reduce_hubo(hubo_terms, hubo.offset)
+            elapsed = time.perf_counter() - start
+            report = formulation.quadratization.report()
+            print("{:>5} {:>10} {:>8} {:>12.3e} {:>9.4f}".format(
+                bits, name, report["aux_count"], report["max_coef"], elapsed))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 32)
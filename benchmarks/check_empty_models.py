@@ -0,0 +1,48 @@
+"""
+Run the semiprimes whose model is emptied by the preprocessing, every variable being fixed, through the mock QPU:
+each formulation on its own and in a sweep. The QPU reports of such runs have no chains.
+Exits non-zero when a run raises.
+Usage: python -m benchmarks.check_empty_models [--output-root /tmp/check_empty_models]
+"""
+import argparse
+import sys
+import traceback
+
+from formulations import ColumnFormulation, DirectFormulation, RunConfig
+from formulations.sweep import sweep, sweep_jobs
+
+# Semiprimes whose BQM has no variable left after fix_variables
+CASES = [(ColumnFormulation, 35), (ColumnFormulation, 21), (ColumnFormulation, 39), (DirectFormulation, 15)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve the semiprimes with an empty model on the mock QPU")
+    parser.add_argument("--output-root", default="/tmp/check_empty_models")
+    args = parser.parse_args()
+
+    failures = []
+    for formulation, n in CASES:
+        model = formulation()
+        config = RunConfig(solver="qa", qpu="mock", num_reads=10, output_root=args.output_root)
+        try:
+            _, bqm, _ = model.prepare_model(n, config)
+            if len(bqm.variables) > 0:
+                failures.append("{} {} has {} variables left".format(formulation.__name__, n, len(bqm.variables)))
+                continue
+            print(formulation.__name__, n, model.solve(n, config=config))
+        except Exception:
+            failures.append("{} {} raises\n{}".format(formulation.__name__, n, traceback.format_exc()))
+    try:
+        config = RunConfig(qpu="mock", num_reads=10, output_root=args.output_root)
+        for result in sweep(sweep_jobs([35]), formulation="column", config=config):
+            print("sweep", result["n"], result["p"], result["q"])
+    except Exception:
+        failures.append("sweep of 35 raises\n{}".format(traceback.format_exc()))
+
+    for message in failures:
+        print("FAIL", message)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
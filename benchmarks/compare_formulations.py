@@ -0,0 +1,42 @@
+"""
+Side-by-side report of the QUBO size of each formulation against the bit length of n:
+number of variables, number of quadratic terms and maximum |coef|.
+Usage: python -m benchmarks.compare_formulations [max_bits]
+"""
+import random
+import sys
+
+from formulations import ColumnFormulation, DirectFormulation
+from formulations.classical import random_semiprime
+
+
+FORMULATIONS = [DirectFormulation, ColumnFormulation]
+
+
+def model_report(formulation, n):
+    """
+    :return: The size of the QUBO built by the formulation for n
+    """
+    q, offset = formulation.build_qubo(n)
+    bqm = q.to_bqm()
+    return {
+        "formulation": type(formulation).__name__,
+        "num_vars": len(bqm.variables),
+        "num_quadratic": len(bqm.quadratic),
+        "max_coef": q.max_coef()
+    }
+
+
+def main(max_bits=24):
+    rng = random.Random(0)
+    print("{:>5} {:>20} {:>9} {:>11} {:>12}".format("bits", "formulation", "vars", "quadratic", "max |coef|"))
+    for bits in range(8, max_bits + 1, 4):
+        n = random_semiprime(bits, rng)
+        for formulation in FORMULATIONS:
+            report = model_report(formulation(), n)
+            print("{:>5} {:>20} {:>9} {:>11} {:>12.3e}".format(
+                bits, report["formulation"], report["num_vars"], report["num_quadratic"], report["max_coef"]))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 24)
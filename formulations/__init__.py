@@ -1,4 +1,9 @@
 from formulations.base import Formulation
+from formulations.column import ColumnFormulation
+from formulations.config import RunConfig
 from formulations.direct import DirectFormulation
+from formulations.dispatch import factorize
+from formulations.hubo import PolyArray
+from formulations.qubo import SparseQubo
 
-__all__ = ["Formulation", "DirectFormulation"]
\ No newline at end of file
+__all__ = ["Formulation", "DirectFormulation", "ColumnFormulation", "PolyArray", "RunConfig", "SparseQubo", "factorize"]
\ No newline at end of file
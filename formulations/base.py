@@ -1,111 +1,144 @@
-import json
-import os
 from math import log
 
+import numpy as np
+
+from .config import RunConfig
+from .quadratization import get_quadratization
+from .qubo import SparseQubo
+from .store import ResultStore
+from .tracing import NULL_TRACER
+
 
 class Formulation:
-    def __init__(self) -> None:
+    def __init__(self, quadratization="ishikawa") -> None:
+        """
+        :param quadratization: The name of the strategy used to reduce HUBO terms, see QUADRATIZATIONS
+        """
+        self.quadratization = get_quadratization(quadratization)
+        self.tracer = NULL_TRACER
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Clear the variables and the results of the previous n, so the formulation can solve another one
+        """
         self.var_map = {}
         self.var_cnt = 0
         self.fixed_variables = {}
         self.fixed_var_map = {}
+        self.stats = {}
 
-    def solve(self, n) -> (int, int):
+    def solve(self, n, config=None) -> (int, int):
         """
         The base solver for any formulations
         :param n: A safe semiprime
+        :param config: The RunConfig of the run
         :return: A tuple of two integers factorized from n
         """
         raise NotImplementedError
 
     # Helper functions
-    def reduce_deg(self, coef=1, term=()):
+    def new_aux_var(self) -> int:
         """
-        Recursively reduce a HUBO term until it becomes QUBO terms.
-        The formulation for optimization is: x1x2x3 = x3s + 2x1x2 - 4x1s - 4x2s + 6s
-        :param term: The coefficient and a tuple of variables
-        :return: A list of optimized terms
+        Allocate an auxiliary variable for the quadratization
+        :return: The index of the new variable
         """
-        # print(coef, term)
-        if len(term) <= 2:
-            return {term: coef}, 0
         self.var_map[("s", self.var_cnt)] = self.var_cnt
         self.var_cnt += 1
-        new_terms = {}
-        new_offset = 0
-        # prefix = ()
-        # x = term[:-2]
-        prefix = term[:-3]
-        x = term[-3:-2]
-        y = term[-2:-1]
-        z = term[-1:]
-        w = (self.var_map[("s", self.var_cnt - 1)],)
-        if coef < 0:
-            new_terms[x + w] = coef
-            new_terms[y + w] = coef
-            new_terms[z + w] = coef
-            new_terms[w] = -2 * coef
-        else:
-            new_terms[x + w] = coef
-            new_terms[y + w] = coef
-            new_terms[z + w] = coef
-            new_terms[w] = -1 * coef
-            new_terms[x + y] = coef
-            new_terms[y + z] = coef
-            new_terms[z + x] = coef
-            new_terms[x] = -coef
-            new_terms[y] = -coef
-            new_terms[z] = -coef
-            new_offset = coef
-        if len(term) > 3:
-            new_terms = {prefix + new_term: new_terms[new_term] for new_term in new_terms}
-            new_terms[prefix] = new_offset
-            new_offset = 0
-        # ans_terms = {}
-        # ans_offset = new_offset
-        # for new_term in new_terms:
-        #     opt_new_terms, opt_new_offset = self.reduce_deg(new_terms[new_term], new_term)
-        #     for opt_new_term in opt_new_terms:
-        #         if opt_new_term not in ans_terms:
-        #             ans_terms[opt_new_term] = opt_new_terms[opt_new_term]
-        #         else:
-        #             ans_terms[opt_new_term] += opt_new_terms[opt_new_term]
-        #     ans_offset += opt_new_offset
-        return new_terms, new_offset
-
-    def analyze_response(self, response, offset=0, input_dict=None, qubo_dict=None):
+        return self.var_cnt - 1
+
+    def reduce_hubo(self, hubo_terms, hubo_offset=0):
+        """
+        Reduce the HUBO terms until they become QUBO terms, using the quadratization strategy of the formulation
+        :param hubo_terms: A dict mapping tuples of variables to coefficients
+        :param hubo_offset: The offset of the energy
+        :return: A dict of terms of degree at most 2 and the new offset
+        """
+        return self.quadratization.reduce(hubo_terms, hubo_offset, new_var=self.new_aux_var, tracer=self.tracer)
+
+    def to_qubo(self, terms):
+        """
+        :param terms: A dict mapping tuples of at most two variables to coefficients
+        :return: A SparseQubo over every variable of the formulation
+        """
+        return SparseQubo.from_terms(terms, self.var_cnt)
+
+    def analyze_response(self, response, offset=0, input_dict=None, qubo_dict=None, config=None, evaluation=None):
         """
         Analyze the record from the solver
         :param response: The record from the solver
         :param offset: The offset of the energy
         :param input_dict: The input for the solver
-        :param bqm: The binary quadratic model for the solver
-        :return: A tuple of two integers factorized from n
+        :param qubo_dict: The SparseQubo given to the solver
+        :param config: The RunConfig of the run
+        :param evaluation: The result of evaluate_response, computed when not given
+        :return: The statistics, reported as <solver_config>_2
         """
+        if evaluation is None:
+            evaluation = self.evaluate_response(response, offset=offset, input_dict=input_dict)
         num_read = len(response.record)
         non_zero = len(qubo_dict)
-        opt_energy = self.get_opt_energy(input_dict)
-        sol_count = 0
-        opt_count = 0
-        for i in range(0, num_read):
-            energy = response.record.energy[i]
-            sample = response.record.sample[i]
-            num_occurences = response.record.num_occurrences[i]
-            if self.is_answer(sample, input_dict):
-                sol_count += num_occurences
-            if energy + offset == opt_energy:
-                opt_count += num_occurences
-        data_name = os.getenv("INPUT_FILE")
-        output_dir = "output/" + data_name + "/"
+        num_occurrences = response.record.num_occurrences
+        total_count = int(num_occurrences.sum())
+        sol_count = int(num_occurrences[evaluation["is_answer"]].sum())
+        opt_count = int(num_occurrences[evaluation["is_optimal"]].sum())
+        config = config if config is not None else RunConfig()
         stat_dict = {
             "num_reads": num_read,
             "non_zero": non_zero,
-            "sol_pct": int(sol_count) / 1000,
-            "opt_pct": int(opt_count) / 1000
+            "sol_pct": sol_count / total_count,
+            "opt_pct": opt_count / total_count
         }
-        solver_config = os.getenv("SOLVER_CONFIG")
-        with open(output_dir + solver_config + "_2.json", "w") as f:
-            json.dump(stat_dict, f, indent=4)
+        config.write_report("_2", stat_dict)
+        if config.result_store is not None:
+            ResultStore(config.result_store).append(
+                response, evaluation=evaluation, solver_info=config.reports.pop("_1", None),
+                n=input_dict["n"], method=getattr(self, "method", type(self).__name__),
+                solver_config=config.solver_config, input_name=config.input_name, total_count=total_count,
+                sol_count=sol_count, opt_count=opt_count, **config.reports.pop("_2"))
+        return stat_dict
+
+    def evaluate_response(self, response, offset=0, input_dict=None, qubo=None) -> dict:
+        """
+        Decode every sample of the response in a single vectorized pass
+        :param response: The record from the solver
+        :param offset: The offset of the energy
+        :param input_dict: The input for the solver
+        :param qubo: The SparseQubo of the run, to recompute the energies exactly instead of using the float64
+        energies of the solver
+        :return: A dict with the arrays p and q, the energies and the masks is_answer and is_optimal over the records
+        """
+        p, q = self.decode_samples(response.record.sample, variables=response.variables, input_dict=input_dict)
+        if p.dtype != object and len(p) > 0 and int(p.max()) * int(q.max()) > np.iinfo(np.int64).max:
+            p, q = p.astype(object), q.astype(object)
+        is_answer = np.asarray(p * q == input_dict["n"], dtype=bool)
+        energy = response.record.energy if qubo is None else self.qubo_energies(qubo, response)
+        energy = energy + offset
+        is_optimal = np.asarray(energy == self.get_opt_energy(input_dict), dtype=bool)
+        return {"p": p, "q": q, "energy": energy, "is_answer": is_answer, "is_optimal": is_optimal}
+
+    def qubo_energies(self, qubo, response):
+        """
+        Compute the exact energies of the samples on the QUBO, before the variables were fixed
+        :param qubo: The SparseQubo of the run
+        :param response: The samples from the solver, over the variables left after fixing
+        :return: An array of the energies, without the offset
+        """
+        samples = np.zeros((len(response.record), qubo.num_variables), dtype=np.int8)
+        samples[:, list(response.variables)] = response.record.sample
+        for key, value in self.fixed_variables.items():
+            samples[:, self.var_map[key]] = value
+        return qubo.energies(samples)
+
+    def decode_samples(self, samples, variables=None, input_dict=None):
+        """
+        Decode a matrix of samples at once
+        :param samples: The samples from the solver, one row per sample
+        :param variables: The variable of each column, defaults to the order of fixed_var_map
+        :param input_dict: The input for the solver
+        :return: Two arrays of the integers factorized from n
+        """
+        raise NotImplementedError
 
     def is_answer(self, sample, input_dict=None) -> bool:
         """
@@ -0,0 +1,169 @@
+import copy
+import json
+import logging
+import os
+import queue
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .classical import classical_prepass
+from .column import ColumnFormulation
+from .config import RunConfig
+from .direct import DirectFormulation
+from .dispatch import factorize
+from .solvers.embedding_cache import EmbeddingCache
+
+logger = logging.getLogger(__name__)
+
+FORMULATIONS = {
+    "direct": DirectFormulation,
+    "column": ColumnFormulation,
+}
+
+
+def read_semiprimes(path):
+    """
+    Read the semiprimes of a file, or of every file in a directory, one per line
+    :param path: A file or a directory
+    :return: A list of (input name, n) pairs
+    """
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path))
+    else:
+        files = [path]
+    semiprimes = []
+    for file in files:
+        if not os.path.isfile(file):
+            continue
+        with open(file, "r") as f:
+            for line in f:
+                if line.strip():
+                    semiprimes.append((os.path.basename(file), int(line.strip())))
+    return semiprimes
+
+
+def run_job(job):
+    """
+    Factorize a single semiprime, in a worker process
+    :param job: A dict with n, the formulation name and the RunConfig of the run
+    :return: A dict describing the result
+    """
+    n = job["n"]
+    config = job["config"]
+    formulation = FORMULATIONS[job["formulation"]]()
+    result = {"n": n, "formulation": job["formulation"], "config": config.to_dict()}
+    start = time.time()
+    try:
+        p, q = factorize(n, formulation, config=config, prepass=job.get("prepass"))
+        result.update({"p": int(p), "q": int(q), "success": int(p) * int(q) == n, "stats": formulation.stats})
+        result["config"] = config.to_dict()
+    except Exception as e:
+        result.update({"success": False, "error": repr(e)})
+    result["time_elapsed"] = time.time() - start
+    return result
+
+
+def warm_embeddings(jobs):
+    """
+    Search the embeddings of the QA jobs in the background, smallest bit length first, and yield each job once its
+    embedding is in the cache, so the workers sample the small models while the larger ones are still built and
+    embedded.
+    The classical prepass of each job runs here and is handed to the worker, so that the worker builds the same
+    BQM, with the same fixed bits, and hits the cache. Jobs factored classically need no embedding.
+    :param jobs: The jobs of run_job, sharing the target graph of their RunConfig
+    :return: A generator of the jobs, sorted by bit length
+    """
+    jobs = sorted(jobs, key=lambda job: job["n"].bit_length())
+    if len(jobs) == 0 or jobs[0]["config"].embedding_cache_dir is None:
+        yield from jobs
+        return
+    from .solvers.solve_bqm import qpu_child
+
+    cache = EmbeddingCache(jobs[0]["config"].embedding_cache_dir)
+    _, target_edgelist = qpu_child(jobs[0]["config"])
+    pending = deque()
+    for job in jobs:
+        config = copy.copy(job["config"])
+        future = None
+        if config.classical_budget is not None:
+            job["prepass"] = classical_prepass(job["n"], budget=config.classical_budget)
+            config.factor_bounds = job["prepass"]["bounds"]
+        if config.classical_budget is None or job["prepass"]["factors"] is None:
+            _, bqm, _ = FORMULATIONS[job["formulation"]]().prepare_model(job["n"], config)
+            future = cache.warm(bqm, target_edgelist)
+        pending.append((job, future))
+        # Hand over the jobs already embedded while the next models are built
+        while pending and (pending[0][1] is None or pending[0][1].done()):
+            yield _embedded(*pending.popleft())
+    while pending:
+        yield _embedded(*pending.popleft())
+
+
+def _embedded(job, future):
+    """
+    :return: The job, once the search of its embedding is over
+    """
+    if future is not None:
+        try:
+            future.result()
+        except Exception as e:
+            logger.warning("Embedding of %d failed, the job embeds it itself: %r", job["n"], e)
+    return job
+
+
+def run_batch(path, output="output/batch.jsonl", formulation="direct", solver="sa", num_reads=1000,
+              output_root="output", workers=None, result_store=None, classical_budget=0.01, qpu="dwave"):
+    """
+    Factorize every semiprime of a file or directory over a process pool.
+    Each job writes its files to <output_root>/<input name>/<n>/, and the results are appended to a single
+    JSONL file as the jobs finish. With the qa solver, the embeddings are searched ahead of the jobs, see
+    warm_embeddings, and each job is submitted from a feeder thread as soon as its embedding is ready, while the
+    finished ones are written.
+    :param path: A file or a directory of semiprimes
+    :param output: The JSONL file of the results
+    :param formulation: The name of the formulation, see FORMULATIONS
+    :param solver: The solver backend, see SOLVERS
+    :param num_reads: The number of samples drawn for each semiprime
+    :param output_root: The root directory of the per-run files
+    :param workers: The number of worker processes, defaults to the number of CPUs
+    :param result_store: The directory of a ResultStore shared by the jobs, instead of the per-run files
+    :param classical_budget: The time in seconds given to classical factoring before annealing, None to always anneal
+    :param qpu: The QPU of the qa solver, dwave or mock
+    :return: The number of successful factorizations
+    """
+    jobs = [{
+        "n": n,
+        "formulation": formulation,
+        "config": RunConfig(input_name=os.path.join(input_name, str(n)), solver=solver, num_reads=num_reads,
+                            output_root=output_root, result_store=result_store, classical_budget=classical_budget,
+                            qpu=qpu)
+    } for input_name, n in read_semiprimes(path)]
+    output_dir = os.path.dirname(output)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    num_success = 0
+    paths = Counter()
+    finished = queue.Queue()
+
+    def feed():
+        for job in (warm_embeddings(jobs) if solver == "qa" else jobs):
+            executor.submit(run_job, job).add_done_callback(finished.put)
+
+    def fed(future):
+        # Wake the collection up on a failure of the feeder, to raise it
+        if future.exception() is not None:
+            finished.put(future)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, ThreadPoolExecutor(max_workers=1) as feeder, \
+            open(output, "a") as f:
+        feeder.submit(feed).add_done_callback(fed)
+        for _ in range(len(jobs)):
+            result = finished.get().result()
+            num_success += result["success"]
+            paths[result.get("stats", {}).get("path", "error")] += 1
+            f.write(json.dumps(result, default=str) + "\n")
+            f.flush()
+            logger.info("%d %s %s %s", result["n"], result.get("p"), result.get("q"), result["success"])
+    logger.info("Paths: %s", dict(paths))
+    return num_success
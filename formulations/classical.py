@@ -0,0 +1,198 @@
+import random
+import time
+from math import gcd, isqrt, log
+
+# Deterministic Miller-Rabin bases for n < 3.3 * 10^24, a strong probable prime test beyond
+PRIME_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+TRIAL_LIMIT = pow(2, 16)
+# Check the deadline every this many steps of each method
+CHECK_EVERY = 1024
+
+
+def is_probable_prime(n) -> bool:
+    """
+    :param n: A positive integer
+    :return: True if n is prime, certainly below 3.3 * 10^24 and with overwhelming probability above
+    """
+    if n < 2:
+        return False
+    for p in PRIME_BASES:
+        if n % p == 0:
+            return n == p
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for a in PRIME_BASES:
+        x = pow(a, d, n)
+        if x == 1 or x == n - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % n
+            if x == n - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def random_semiprime(bits, rng):
+    """
+    :param bits: The bit length of n, at least 6
+    :param rng: A random.Random
+    :return: A product n of bits bits of two distinct odd primes, of bits // 2 bits and of the remaining bits
+    """
+    p_bits = max(bits // 2, 3)
+    q_bits = max(bits - p_bits, 3)
+    while True:
+        p = rng.getrandbits(p_bits) | (1 << (p_bits - 1)) | 1
+        q = rng.getrandbits(q_bits) | (1 << (q_bits - 1)) | 1
+        # The product of the two leading bits has bits - 1 or bits bits
+        if (p * q).bit_length() == bits and p != q and is_probable_prime(p) and is_probable_prime(q):
+            return p * q
+
+
+def trial_division(n, limit=TRIAL_LIMIT, deadline=None):
+    """
+    :param n: An odd integer
+    :param limit: The largest divisor tried
+    :param deadline: A time.perf_counter() value after which the search gives up
+    :return: The smallest odd factor of n up to limit, or None, and the largest divisor tried
+    """
+    limit = min(limit, isqrt(n))
+    d = 3
+    while d <= limit:
+        if deadline is not None and time.perf_counter() > deadline:
+            return None, d - 2
+        for d in range(d, min(d + 2 * CHECK_EVERY, limit + 1), 2):
+            if n % d == 0:
+                return d, d
+        d += 2
+    return None, limit
+
+
+def fermat(n, deadline=None):
+    """
+    Fermat's method, which finds the factors of n = a^2 - b^2 = (a - b)(a + b) quickly when they are close
+    :param n: An odd composite
+    :param deadline: A time.perf_counter() value after which the search gives up
+    :return: The smaller factor or None, and the largest a tried
+    """
+    a = isqrt(n)
+    if a * a < n:
+        a += 1
+    last = (n + 9) // 6
+    while a <= last:
+        for _ in range(CHECK_EVERY):
+            b = isqrt(a * a - n)
+            if b * b == a * a - n:
+                return a - b, a
+            a += 1
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+    return None, a - 1
+
+
+def pollard_rho(n, deadline=None, seed=0):
+    """
+    Pollard's rho with Brent's cycle detection and batched gcds
+    :param n: An odd composite
+    :param deadline: A time.perf_counter() value after which the search gives up
+    :param seed: The seed of the random polynomials
+    :return: A non-trivial factor of n, or None
+    """
+    rng = random.Random(seed)
+    while deadline is None or time.perf_counter() < deadline:
+        y, c = rng.randrange(1, n), rng.randrange(1, n)
+        g = r = q = 1
+        x = ys = y
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(CHECK_EVERY, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd(q, n)
+                k += CHECK_EVERY
+                if g == 1 and deadline is not None and time.perf_counter() > deadline:
+                    return None
+            r *= 2
+        if g == n:
+            # The batch overshot, redo its steps one gcd at a time
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd(abs(x - ys), n)
+        if g != n:
+            return g
+    return None
+
+
+def semiprime_issues(n, p, q):
+    """
+    Check the safe semiprime precondition of the formulations: n is the product of two odd primes that differ
+    and that both fit in the l bits of the factors of the model
+    :param n: The product p * q
+    :param p: The smaller factor
+    :param q: The larger factor
+    :return: A list of the violated conditions: even, square, not_semiprime, unbalanced
+    """
+    l = int(log(n, 2)) // 2 + 1
+    issues = []
+    if p == 2:
+        issues.append("even")
+    if p == q:
+        issues.append("square")
+    if not (is_probable_prime(p) and is_probable_prime(q)):
+        issues.append("not_semiprime")
+    if q >= pow(2, l):
+        issues.append("unbalanced")
+    return issues
+
+
+def classical_prepass(n, budget=0.01, trial_limit=TRIAL_LIMIT, seed=0):
+    """
+    Try to factor n classically within a time budget: perfect squares and even n at once, then trial division,
+    Fermat's method for a quarter of the budget and Pollard's rho for the rest.
+    When every method fails, the search still bounds the smaller factor p: trial division proves p > the largest
+    divisor tried, and Fermat's method p < a - sqrt(a^2 - n) for the largest a tried.
+    :param n: An integer greater than 3
+    :param budget: The time budget in seconds, 0 to run the instant checks only
+    :param trial_limit: The largest divisor of the trial division
+    :param seed: The seed of Pollard's rho
+    :return: A dict with the path that factored n or None, the factors (p, q) with p <= q or None,
+    the bounds (low, high) of p, the violated conditions of semiprime_issues and the time spent
+    """
+    start = time.perf_counter()
+    if n < 4 or is_probable_prime(n):
+        raise ValueError("{} is not a composite integer".format(n))
+    deadline = start + budget
+    root = isqrt(n)
+    low, high = 3, root
+    factor, path = None, None
+    if root * root == n:
+        factor, path = root, "square"
+    elif n % 2 == 0:
+        factor, path = 2, "trial_division"
+    if factor is None and budget > 0:
+        factor, tried = trial_division(n, trial_limit, deadline)
+        low = max(low, tried + 1)
+        path = "trial_division"
+    if factor is None and budget > 0:
+        factor, a = fermat(n, start + budget / 4)
+        high = min(high, a - isqrt(a * a - n))
+        path = "fermat"
+    if factor is None and budget > 0:
+        factor = pollard_rho(n, deadline, seed)
+        path = "pollard_rho"
+
+    result = {"path": None, "factors": None, "bounds": (low, high), "issues": [], "time": 0.0}
+    if factor is not None:
+        p, q = sorted((factor, n // factor))
+        result.update(path=path, factors=(p, q), bounds=(p, p), issues=semiprime_issues(n, p, q))
+    result["time"] = time.perf_counter() - start
+    return result
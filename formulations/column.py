@@ -0,0 +1,68 @@
+from math import log
+
+from .direct import DirectFormulation
+from .hubo import PolyArray
+
+
+class ColumnFormulation(DirectFormulation):
+    """
+    Encode the multiplication table of p * q column by column.
+    Column k holds the partial products p_i q_j with i + j = k and the carries coming into it,
+    and adds the local penalty (sum p_i q_j + carries in - n_k - sum_m 2^m c_{k, k + m})^2.
+    The coefficients are bounded by the column sizes instead of growing like 2^(2l).
+    """
+    method = "CO"
+
+    def __init__(self, quadratization="rosenberg"):
+        super().__init__(quadratization=quadratization)
+
+    def build_template_hubo(self, n):
+        """
+        Split each column penalty (S_k - n_k)^2 = S_k^2 + n_k(1 - 2S_k), using n_k^2 = n_k
+        :param n: A safe semiprime, of which only template_key(n) is used
+        :return: The sum of the S_k^2 and the list of the 1 - 2S_k, scaled by the bits of n
+        """
+        l, last_col = self.template_key(n)
+        self.init_base_vars(l)
+        p_vars = [()] + [(self.var_map[("x", i)],) for i in range(1, l)]
+        q_vars = [()] + [(self.var_map[("x", j + l)],) for j in range(1, l)]
+
+        carries_in = [[] for _ in range(last_col + 1)]
+        columns = []
+        features = []
+        for k in range(0, last_col + 1):
+            terms = {}
+            for i in range(max(0, k - l + 1), min(k, l - 1) + 1):
+                term = p_vars[i] + q_vars[k - i]
+                terms[term] = terms.get(term, 0) + 1
+            for carry in carries_in[k]:
+                terms[(carry,)] = 1
+            max_sum = sum(terms.values())
+
+            # Init carries out of column k
+            for m in range(1, (max_sum // 2).bit_length() + 1):
+                if k + m > last_col:
+                    break
+                self.var_map[("c", k, m)] = self.var_cnt
+                carries_in[k + m].append(self.var_cnt)
+                terms[(self.var_cnt,)] = -pow(2, m)
+                self.var_cnt += 1
+            column = PolyArray.from_dict(terms)
+            columns.append(column.square())
+            feature = column.scale(-2)
+            features.append(PolyArray(feature.indices, feature.coefs, feature.offset + 1))
+        return PolyArray.concatenate(columns), features
+
+    def template_key(self, n):
+        """
+        :return: The number of bits of each factor and the index of the last column
+        """
+        l = int(log(n, 2)) // 2 + 1
+        return l, max(2 * l - 2, n.bit_length() - 1)
+
+    def template_features(self, n):
+        """
+        :return: The bits of n, one per column
+        """
+        _, last_col = self.template_key(n)
+        return [(n >> k) & 1 for k in range(last_col + 1)]
@@ -0,0 +1,147 @@
+import json
+import os
+
+
+class RunConfig:
+    """
+    The context of a single run, passed explicitly from the formulation to the solvers instead of through
+    environment variables, so that concurrent runs on one machine do not interfere
+    """
+
+    def __init__(self, input_name=".inp", solver="qa", num_reads=1000, output_root="output",
+                 embedding_cache=".embeddings", target_graph=None, num_sweeps=100, beta_range=None,
+                 sa_mode="anneal", workers=None, stream_batch=None, qpu="dwave",
+                 trace=None, model_template=True, chain_strength_prefactor=0.25, annealing_time=200,
+                 anneal_schedule_id=-1, tuning=None, result_store=None, precision="warn", subproblem_size=64,
+                 subsolver="sa", selection="energy", max_iterations=50, subproblem_submissions=1,
+                 classical_budget=0.01) -> None:
+        """
+        :param input_name: The name of the input, results are written to <output_root>/<input_name>/
+        :param solver: The solver backend, see SOLVERS
+        :param num_reads: The number of samples drawn by the solver
+        :param output_root: The root directory of the results
+        :param embedding_cache: The directory of the embedding cache, relative to output_root unless absolute,
+        or None to embed on every run
+        :param target_graph: A JSON file of the QPU graph, see generate_target_graph. The graph of the QPU is
+        used when not given.
+        :param num_sweeps: The number of sweeps of the simulated annealing solvers
+        :param beta_range: The (hot, cold) inverse temperatures of the sa and psa solvers, derived from the biases
+        when None
+        :param sa_mode: anneal or tempering, the mode of the psa solver
+        :param workers: The number of worker processes of the psa solver, defaults to the number of CPUs
+        :param stream_batch: Sample in batches of this many reads and stop at the first valid factorization,
+        or None to draw every read at once
+        :param qpu: dwave for the QPU of the D-Wave account, or mock for MockQPUSampler on target_graph,
+        a Pegasus P16 graph when target_graph is not given
+        :param trace: json or chrome to write the timed spans of the pipeline to <solver_config>_trace.json,
+        or None to disable tracing
+        :param model_template: Build the model of n from the template of its bit length, compiled once per process,
+        instead of from scratch
+        :param chain_strength_prefactor: The prefactor of uniform_torque_compensation on the QPU
+        :param annealing_time: The annealing time on the QPU in microseconds, used when anneal_schedule_id is -1
+        :param anneal_schedule_id: A key of SCHEDULES, or -1 for a plain anneal of annealing_time
+        :param tuning: A JSON file written by the tuner, whose best configuration for the bit length of n
+        overrides the solver parameters of the run
+        :param result_store: The directory of a ResultStore receiving the samples and the reports of the run
+        instead of the _1.json and _2.json files, or None to write the files
+        :param precision: What to do when the energies of the QUBO are not exact in the float64 BQM: warn to convert
+        anyway, raise to refuse, or rescale to divide the coefficients by a power of two with a bounded error
+        :param subproblem_size: The number of variables of each subproblem of the decomp solver
+        :param subsolver: sa or qa, the backend of the subproblems of the decomp solver, see qpu for qa
+        :param selection: energy or bits, how the decomp solver selects the variables of its subproblems,
+        by energy impact or by the bit position of p and q first
+        :param max_iterations: The maximum number of iterations of the decomp solver
+        :param subproblem_submissions: The number of QPU problems submitted for each subproblem of the decomp solver
+        with the qa subsolver, built from the best incumbents, whatever num_reads is
+        :param classical_budget: The time in seconds given to classical factoring by factorize before the formulation
+        is solved, 0 for the instant checks of primes, even n and squares only, or None to always anneal
+        """
+        self.input_name = input_name
+        self.solver = solver
+        self.num_reads = num_reads
+        self.output_root = output_root
+        self.embedding_cache = embedding_cache
+        self.target_graph = target_graph
+        self.num_sweeps = num_sweeps
+        self.beta_range = beta_range
+        self.sa_mode = sa_mode
+        self.workers = workers
+        self.stream_batch = stream_batch
+        self.qpu = qpu
+        self.trace = trace
+        self.model_template = model_template
+        self.chain_strength_prefactor = chain_strength_prefactor
+        self.annealing_time = annealing_time
+        self.anneal_schedule_id = anneal_schedule_id
+        self.tuning = tuning
+        self.result_store = result_store
+        self.precision = precision
+        self.subproblem_size = subproblem_size
+        self.subsolver = subsolver
+        self.selection = selection
+        self.max_iterations = max_iterations
+        self.subproblem_submissions = subproblem_submissions
+        self.classical_budget = classical_budget
+        self.solver_config = None
+        self.variable_priority = None
+        self.factor_bounds = None
+        self.reports = {}
+
+    @property
+    def output_dir(self) -> str:
+        output_dir = os.path.join(self.output_root, self.input_name) + "/"
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        return output_dir
+
+    @property
+    def embedding_cache_dir(self):
+        """
+        :return: The directory of the embedding cache, or None when it is disabled
+        """
+        if not self.embedding_cache:
+            return None
+        return os.path.join(self.output_root, self.embedding_cache)
+
+    def write_report(self, suffix, report) -> None:
+        """
+        Write a report of the run to <solver_config><suffix>.json, or keep it for the result store
+        :param suffix: _1 for the report of the solver, _2 for the statistics of the samples
+        :param report: A JSON-serializable dict
+        """
+        if self.result_store is not None:
+            self.reports[suffix] = report
+            return
+        with open(self.output_dir + self.solver_config + suffix + ".json", "w") as f:
+            json.dump(report, f, indent=4)
+
+    def to_dict(self) -> dict:
+        return {
+            "input_name": self.input_name,
+            "solver": self.solver,
+            "num_reads": self.num_reads,
+            "output_root": self.output_root,
+            "embedding_cache": self.embedding_cache,
+            "target_graph": self.target_graph,
+            "num_sweeps": self.num_sweeps,
+            "beta_range": self.beta_range,
+            "sa_mode": self.sa_mode,
+            "workers": self.workers,
+            "stream_batch": self.stream_batch,
+            "qpu": self.qpu,
+            "trace": self.trace,
+            "model_template": self.model_template,
+            "chain_strength_prefactor": self.chain_strength_prefactor,
+            "annealing_time": self.annealing_time,
+            "anneal_schedule_id": self.anneal_schedule_id,
+            "tuning": self.tuning,
+            "result_store": self.result_store,
+            "precision": self.precision,
+            "subproblem_size": self.subproblem_size,
+            "subsolver": self.subsolver,
+            "selection": self.selection,
+            "max_iterations": self.max_iterations,
+            "subproblem_submissions": self.subproblem_submissions,
+            "classical_budget": self.classical_budget,
+            "solver_config": self.solver_config
+        }
@@ -1,138 +1,80 @@
-from collections import defaultdict
+import logging
 from math import log
 
-from dimod import BinaryQuadraticModel
+import numpy as np
 
 from .base import Formulation
-from .solvers import solve_quantum_annealing, solve_simulated_annealing
+from .config import RunConfig
+from .hubo import PolyArray
+from .preprocessing import factor_bit_fixings, roof_duality_fixings
+from .qubo import FLOAT64_EXACT_BITS
+from .solvers import SOLVERS
+from .template import get_template
+from .tracing import Tracer
+from .tuning import apply_tuning
+
+logger = logging.getLogger(__name__)
 
 
 class DirectFormulation(Formulation):
-    def __init__(self):
-        super().__init__()
+    method = "DI"
 
-    def solve(self, n):
-        l = int(log(n, 2)) // 2 + 1
-        # print(l)
+    def __init__(self, quadratization="ishikawa"):
+        super().__init__(quadratization=quadratization)
 
-        # Init base variables
-        for i in range(0, l * 2):
-            if i == 0 or i == l:
-                continue
-            self.var_map[("x", i)] = self.var_cnt
-            self.var_cnt += 1
-        # print(self.var_map)
+    def solve(self, n, config=None):
+        config = config if config is not None else RunConfig()
+        if config.tuning is not None:
+            logger.info("Tuned configuration: %s", apply_tuning(config, self.method, n))
+        self.tracer = Tracer(enabled=config.trace is not None)
+        q, bqm, hubo_offset = self.prepare_model(n, config)
 
-        # Init pq HUBO
-        pq_terms = {}
-        pq_offset = 0
-        for i in range(0, l):
-            for j in range(0, l):
-                var_tuple = (0, 0)
-                if i == 0:
-                    if j == 0:
-                        pq_offset += 1
-                    else:
-                        var_tuple = (self.var_map[("x", j + l)],)
-                elif j == 0:
-                    var_tuple = (self.var_map[("x", i)],)
-                else:
-                    var_tuple = (self.var_map[("x", i)], self.var_map[("x", j + l)])
-                if var_tuple != (0, 0):
-                    pq_terms[var_tuple] = pow(2, i + j)
-        print(pq_terms)
-        print(pq_offset)
-
-        # Init (n - pq)^2 HUBO
-        hubo_terms = {}
-        pq_terms[()] = pq_offset - n
-        for term1 in pq_terms.keys():
-            for term2 in pq_terms.keys():
-                var_coef = pq_terms[term1] * pq_terms[term2]
-                var_set = set(list(term1) + list(term2))
-                var_tuple = tuple(var_set)
-                if var_tuple not in hubo_terms:
-                    hubo_terms[var_tuple] = var_coef
-                else:
-                    hubo_terms[var_tuple] += var_coef
-        hubo_offset = hubo_terms[()]
-        hubo_terms.pop(())
-        print("HUBO created with terms: ", hubo_terms)
-        print("Offset: ", hubo_offset)
+        # Solve QUBO
+        with self.tracer.span("sampling", solver=config.solver, num_vars=len(bqm.variables)) as span:
+            if config.stream_batch:
+                from .solvers.streaming import solve_streaming
 
-        # Optimize HUBO
-        # print(self.reduce_deg(1, (0, 1, 2, 3)))
-        for deg in range(4, 2, -1):
-            opt_hubo_terms = {}
-            for term in hubo_terms:
-                new_opt_terms = {term: hubo_terms[term]}
-                new_opt_offset = 0
-                if len(term) == deg:
-                    new_opt_terms, new_opt_offset = self.reduce_deg(hubo_terms[term], term)
-                for new_opt_term in new_opt_terms:
-                    if new_opt_term not in opt_hubo_terms:
-                        opt_hubo_terms[new_opt_term] = new_opt_terms[new_opt_term]
-                    else:
-                        opt_hubo_terms[new_opt_term] += new_opt_terms[new_opt_term]
-                hubo_offset += new_opt_offset
-            print("HUBO terms after removing terms of deg {}:".format(deg), opt_hubo_terms)
-            hubo_terms = opt_hubo_terms.copy()
+                def stop_when(batch):
+                    return self.evaluate_response(batch, offset=hubo_offset, input_dict={"n": n})["is_answer"]
 
-        # Initialize QUBO
-        q = defaultdict(int)
-        for term in hubo_terms:
-            if len(term) == 2:
-                q[term] = hubo_terms[term]
+                response = solve_streaming(bqm=bqm, method=self.method, num_reads=config.num_reads, config=config,
+                                           stop_when=stop_when)
             else:
-                q[term[0], term[0]] = hubo_terms[term]
-        print(q)
-        bqm = BinaryQuadraticModel.from_qubo(q)
-        max_coef = max([abs(q[term]) for term in q])
-        print("Maximum coefficient:", max_coef)
-
-        # # 143
-        # bqm.fix_variable(self.var_map[("x", 1)], 0)
-        # bqm.fix_variable(self.var_map[("x", 2)], 1)
-        # bqm.fix_variable(self.var_map[("x", 3)], 1)
-        # bqm.fix_variable(self.var_map[("x", 5)], 1)
-        # bqm.fix_variable(self.var_map[("x", 6)], 0)
-        # bqm.fix_variable(self.var_map[("x", 7)], 1)
-        # self.fixed_variables[("x", 1)] = 0
-        # self.fixed_variables[("x", 2)] = 1
-        # self.fixed_variables[("x", 3)] = 1
-        # self.fixed_variables[("x", 5)] = 1
-        # self.fixed_variables[("x", 6)] = 0
-        # self.fixed_variables[("x", 7)] = 1
-
-        # 391
-        # bqm.fix_variable(self.var_map[("x", 1)], 0)
-        # bqm.fix_variable(self.var_map[("x", 2)], 0)
-        # bqm.fix_variable(self.var_map[("x", 3)], 0)
-        # bqm.fix_variable(self.var_map[("x", 4)], 1)
-        # bqm.fix_variable(self.var_map[("x", 6)], 1)
-        # bqm.fix_variable(self.var_map[("x", 7)], 1)
-        # bqm.fix_variable(self.var_map[("x", 8)], 0)
-        # bqm.fix_variable(self.var_map[("x", 9)], 1)
-        # self.fixed_variables[("x", 1)] = 0
-        # self.fixed_variables[("x", 2)] = 0
-        # self.fixed_variables[("x", 3)] = 0
-        # self.fixed_variables[("x", 4)] = 1
-        # self.fixed_variables[("x", 6)] = 1
-        # self.fixed_variables[("x", 7)] = 1
-        # self.fixed_variables[("x", 8)] = 0
-        # self.fixed_variables[("x", 9)] = 1
-
-        # # 1961
-        # bqm.fix_variable(self.var_map[("x", 1)], 0)
-        # bqm.fix_variable(self.var_map[("x", 2)], 1)
-        # bqm.fix_variable(self.var_map[("x", 3)], 0)
-        # bqm.fix_variable(self.var_map[("x", 4)], 0)
-        # bqm.fix_variable(self.var_map[("x", 5)], 1)
-        # bqm.fix_variable(self.var_map[("x", 7)], 0)
-        # bqm.fix_variable(self.var_map[("x", 8)], 1)
-        # bqm.fix_variable(self.var_map[("x", 9)], 0)
-        # bqm.fix_variable(self.var_map[("x", 10)], 1)
-        # bqm.fix_variable(self.var_map[("x", 11)], 1)
+                solver = SOLVERS[config.solver]
+                response = solver(bqm=bqm, method=self.method, num_reads=config.num_reads, config=config)
+            span.count(num_reads=int(response.record.num_occurrences.sum()))
+        return self.report_response(n, response, q, hubo_offset, config)
+
+    def prepare_model(self, n, config):
+        """
+        Build the BQM of n and fix the variables that can be derived classically
+        :param n: A safe semiprime
+        :param config: The RunConfig of the run
+        :return: The SparseQubo, the BQM after fixing and the offset of the energy
+        """
+        self.reset()
+        if config.model_template:
+            with self.tracer.span("template") as span:
+                template = get_template(self, n)
+                q, hubo_offset = template.instantiate(self.template_features(n))
+                self.var_map = dict(template.var_map)
+                self.var_cnt = template.var_cnt
+                span.count(num_terms=len(q))
+            logger.info("Quadratization: %s", template.report)
+        else:
+            q, hubo_offset = self.build_qubo(n)
+        with self.tracer.span("bqm") as span:
+            bqm, precision = self.build_bqm(q, config)
+            span.count(num_vars=len(bqm.variables), num_quadratic=len(bqm.quadratic), **precision)
+        logger.info("Maximum coefficient: %s", precision["max_coef"])
+
+        # Fix variables classically
+        with self.tracer.span("fixing") as span:
+            # The persistencies of a rescaled BQM that lost the ordering of the energies may be wrong for n
+            report = self.fix_variables(n, bqm, bounds=config.factor_bounds,
+                                        roof_duality=precision.get("ordering_kept", True))
+            span.count(**report)
+        logger.info("Preprocessing: %s", report)
 
         self.fixed_var_map = self.var_map.copy()
         for fixed_key in self.fixed_variables.keys():
@@ -141,45 +83,233 @@ class DirectFormulation(Formulation):
         for key in self.fixed_var_map.keys():
             self.fixed_var_map[key] = new_cnt
             new_cnt += 1
+        config.variable_priority = self.variable_priority(n)
+        return q, bqm, hubo_offset
 
-        # Solve QUBO
-        # response = solve_simulated_annealing(bqm=bqm, method="DI", num_reads=1000)
-        response = solve_quantum_annealing(bqm=bqm, method="DI", num_reads=1000)
-
-        # Analyze result
-        energy = response.record.energy[0]
-        sample = response.record.sample[0]
-        self.analyze_response(response, offset=hubo_offset, input_dict={"n": n}, qubo_dict=q)
-        for i in range(0, len(response.record.sample)):
-            energy = min(energy, response.record.energy[i])
-            if self.is_answer(response.record.sample[i], input_dict={"n": n}):
-                sample = response.record.sample[i]
-        print("Best energy: ", energy + hubo_offset)
-        ans1, ans2 = self.get_answer(sample, input_dict={"n": n})
-        print(ans1, ans2)
+    def build_bqm(self, q, config):
+        """
+        Convert the QUBO to a float64 BQM, checking first that its coefficients and energies stay exact.
+        On precision loss, config.precision decides: warn converts anyway, raise refuses, and rescale divides
+        the coefficients by a power of two with a bounded error on the energies.
+        The analysis recomputes the energies exactly on q in every case, and roof duality is skipped when the
+        rescaling loses the ordering of the energies.
+        :param q: The SparseQubo of n
+        :param config: The RunConfig of the run
+        :return: The BQM and the precision report of the conversion
+        """
+        precision = q.check_precision()
+        if not precision["exact"]:
+            message = "The energies of the QUBO need {} bits, float64 holds {} exactly".format(
+                precision["bits"], FLOAT64_EXACT_BITS)
+            if config.precision == "raise":
+                raise ValueError(message)
+            if config.precision == "rescale":
+                q, rescaling = q.rescale()
+                precision.update(rescaling)
+                logger.warning("%s, coefficients divided by %s with an energy error of at most %s",
+                               message, rescaling["scale"], rescaling["max_error"])
+                if not rescaling["ordering_kept"]:
+                    logger.warning("The rescaled energies do not keep the ordering of the exact ones: the solver may "
+                                   "miss the ground states, and roof duality is skipped")
+            else:
+                logger.warning("%s, energies of the solver may be wrong", message)
+        return q.to_bqm(), precision
+
+    def report_response(self, n, response, q, hubo_offset, config):
+        """
+        Analyze the samples of n, write the statistics of the run and pick the answer
+        :param n: A safe semiprime
+        :param response: The samples from the solver
+        :param q: The SparseQubo of n
+        :param hubo_offset: The offset of the energy
+        :param config: The RunConfig of the run, with the solver_config set by the solver
+        :return: A tuple of two integers factorized from n
+        """
+        with self.tracer.span("analysis") as span:
+            evaluation = self.evaluate_response(response, offset=hubo_offset, input_dict={"n": n}, qubo=q)
+            self.stats = self.analyze_response(response, offset=hubo_offset, input_dict={"n": n}, qubo_dict=q,
+                                               config=config, evaluation=evaluation)
+            span.count(**self.stats)
+        answers = np.flatnonzero(evaluation["is_answer"])
+        best = answers[-1] if len(answers) > 0 else 0
+        logger.info("Best energy: %s", evaluation["energy"].min())
+        ans1, ans2 = int(evaluation["p"][best]), int(evaluation["q"][best])
+        logger.info("Answer: %d %d", ans1, ans2)
+        if config.trace is not None:
+            self.tracer.write(config.output_dir + config.solver_config + "_trace.json", trace_format=config.trace)
         return ans1, ans2
 
+    def build_qubo(self, n):
+        """
+        Build the HUBO of n and reduce it to a QUBO
+        :param n: A safe semiprime
+        :return: A SparseQubo and the offset
+        """
+        with self.tracer.span("hubo") as span:
+            hubo = self.build_hubo(n)
+            hubo_terms, hubo_offset = hubo.to_dict(), hubo.offset
+            span.count(num_terms=len(hubo_terms), degree=hubo.degree, num_vars=self.var_cnt)
+        logger.debug("HUBO created with terms: %s", hubo_terms)
+        logger.debug("Offset: %s", hubo_offset)
+
+        # Optimize HUBO
+        with self.tracer.span("quadratization") as span:
+            hubo_terms, hubo_offset = self.reduce_hubo(hubo_terms, hubo_offset)
+            span.count(num_terms=len(hubo_terms), **self.quadratization.report())
+        logger.debug("HUBO terms after quadratization: %s", hubo_terms)
+        logger.info("Quadratization: %s", self.quadratization.report())
+
+        # Initialize QUBO
+        with self.tracer.span("qubo") as span:
+            q = self.to_qubo(hubo_terms)
+            span.count(num_terms=len(q))
+        logger.debug("QUBO: %s", q.to_dict())
+        return q, hubo_offset
+
+    def build_hubo(self, n):
+        """
+        Build the (n - pq)^2 HUBO, as the template base plus the features of n
+        :param n: A safe semiprime
+        :return: A PolyArray holding the HUBO terms and the offset
+        """
+        base, features = self.build_template_hubo(n)
+        scaled = [feature.scale(factor) for feature, factor in zip(features, self.template_features(n))]
+        return PolyArray.concatenate([base] + scaled)
+
+    def build_template_hubo(self, n):
+        """
+        Split (n - pq)^2 = (pq)^2 + n(-2pq) + n^2 into the part that depends on the bit length of n only
+        and the quadratic terms scaled by n and n^2, built with integer-indexed arrays
+        :param n: A safe semiprime, of which only template_key(n) is used
+        :return: The base PolyArray, and the list of PolyArray scaled by template_features(n)
+        """
+        l = self.template_key(n)
+        self.init_base_vars(l)
+
+        # Init pq HUBO
+        p_vars = np.array([-1] + [self.var_map[("x", i)] for i in range(1, l)], dtype=np.int64)
+        q_vars = np.array([-1] + [self.var_map[("x", j + l)] for j in range(1, l)], dtype=np.int64)
+        i, j = np.meshgrid(np.arange(l), np.arange(l), indexing="ij")
+        pq_indices = np.stack([p_vars[i.ravel()], q_vars[j.ravel()]], axis=1)
+        pq_coefs = [pow(2, int(k)) for k in (i + j).ravel()]
+        pq = PolyArray.from_arrays(pq_indices, pq_coefs, 0)
+        return pq.square(), [pq.scale(-2), PolyArray.from_dict({}, 1)]
+
+    def template_key(self, n):
+        """
+        :return: The key shared by the semiprimes with the same model template, the number of bits of each factor
+        """
+        return int(log(n, 2)) // 2 + 1
+
+    def template_features(self, n):
+        """
+        :return: The factors of the terms of build_template_hubo that depend on n
+        """
+        return [n, n * n]
+
+    def fix_variables(self, n, bqm, bounds=None, roof_duality=True):
+        """
+        Fix variables of the BQM classically and record them in fixed_variables.
+        The bits of p and q derived from n are fixed first, then roof duality is run on the BQM,
+        and both are repeated while roof duality reveals new bits of p and q.
+        :param n: A safe semiprime
+        :param bqm: The binary quadratic model, which is modified in place
+        :param bounds: The bounds (low, high) of the smaller factor from classical_prepass, or None
+        :param roof_duality: Whether to run roof duality, which is only sound when the energies of the BQM are
+        ordered like the exact ones
+        :return: A dict with the number of variables eliminated by each stage
+        """
+        l = int(log(n, 2)) // 2 + 1
+        var_names = {index: key for key, index in self.var_map.items()}
+        report = {"num_vars": len(bqm.variables), "modular": 0, "roof_duality": 0}
+        new_fixed = factor_bit_fixings(n, l, bounds=bounds)
+        while True:
+            for key, value in new_fixed.items():
+                if self.var_map[key] in bqm.variables:
+                    bqm.fix_variable(self.var_map[key], value)
+                    self.fixed_variables[key] = value
+                    report["modular"] += 1
+            for index, value in (roof_duality_fixings(bqm) if roof_duality else {}).items():
+                bqm.fix_variable(index, value)
+                self.fixed_variables[var_names[index]] = value
+                report["roof_duality"] += 1
+            known = {key: value for key, value in self.fixed_variables.items() if key[0] == "x"}
+            new_fixed = {key: value for key, value in factor_bit_fixings(n, l, known).items()
+                         if key not in self.fixed_variables}
+            if not new_fixed:
+                break
+        report["eliminated"] = report["num_vars"] - len(bqm.variables)
+        return report
+
+    def variable_priority(self, n):
+        """
+        :param n: A safe semiprime
+        :return: A dict mapping the unfixed bits of p and q to their bit position, the other variables having none,
+        so the bits selection of the decomp solver takes the most significant bits first
+        """
+        l = int(log(n, 2)) // 2 + 1
+        priority = {}
+        for i in range(1, l * 2):
+            if ("x", i) in self.var_map and ("x", i) not in self.fixed_variables:
+                priority[self.var_map[("x", i)]] = i if i < l else i - l
+        return priority
+
+    def init_base_vars(self, l):
+        """
+        Register the bits of p and q, ("x", i) for p and ("x", l + j) for q. The lowest bits are always 1.
+        :param l: The number of bits of each factor
+        """
+        for i in range(0, l * 2):
+            if i == 0 or i == l:
+                continue
+            self.var_map[("x", i)] = self.var_cnt
+            self.var_cnt += 1
+
     def is_answer(self, sample, input_dict=None):
         n = input_dict["n"]
         ans1, ans2 = self.get_answer(sample, input_dict=input_dict)
         return ans1 * ans2 == n
 
     def get_answer(self, sample, input_dict=None):
-        full_sample = []
-        for cur_var in self.var_map.keys():
-            if cur_var in self.fixed_variables:
-                full_sample.append(self.fixed_variables[cur_var])
-            else:
-                full_sample.append(sample[self.fixed_var_map[cur_var]])
+        p, q = self.decode_samples(np.asarray([sample]), input_dict=input_dict)
+        return int(p[0]), int(q[0])
+
+    def decode_samples(self, samples, variables=None, input_dict=None):
         n = input_dict["n"]
-        ans1 = 1
-        ans2 = 1
         l = int(log(n, 2)) // 2 + 1
-        for i in range(1, l):
-            ans1 += full_sample[self.var_map[("x", i)]] * pow(2, i)
-        for i in range(l + 1, l * 2):
-            ans2 += full_sample[self.var_map[("x", i)]] * pow(2, i - l)
-        return ans1, ans2
+        samples = np.asarray(samples)
+        if variables is None:
+            columns = self.fixed_var_map if self.fixed_var_map else self.var_map
+        else:
+            position = {v: i for i, v in enumerate(variables)}
+            columns = {key: position[index] for key, index in self.var_map.items() if index in position}
+        dtype = np.int64 if l <= 62 else object
+        p = self.decode_bits(samples, columns, range(1, l), 0, dtype)
+        q = self.decode_bits(samples, columns, range(l + 1, l * 2), l, dtype)
+        return p, q
+
+    def decode_bits(self, samples, columns, bits, shift, dtype):
+        """
+        Decode one factor as a dot product of the sample columns with a weight vector
+        :param samples: The samples from the solver, one row per sample
+        :param columns: A dict mapping the unfixed variables to their columns
+        :param bits: The variables ("x", i) of the factor
+        :param shift: The index of the lowest bit of the factor
+        :param dtype: int64, or object for factors of more than 62 bits
+        :return: An array of the factor
+        """
+        value = 1
+        indices = []
+        weights = []
+        for i in bits:
+            if ("x", i) in self.fixed_variables:
+                value += self.fixed_variables[("x", i)] << (i - shift)
+            else:
+                indices.append(columns[("x", i)])
+                weights.append(1 << (i - shift))
+        if len(indices) == 0:
+            return np.full(len(samples), value, dtype=dtype)
+        return samples[:, indices].astype(dtype) @ np.array(weights, dtype=dtype) + value
 
     def get_opt_energy(self, input_dict=None) -> int:
         return 0
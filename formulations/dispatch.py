@@ -0,0 +1,51 @@
+import logging
+
+from .classical import classical_prepass
+from .config import RunConfig
+
+logger = logging.getLogger(__name__)
+
+
+def annealing_path(n, p, q):
+    """
+    :param n: A composite integer
+    :param p: The first factor returned by the annealing
+    :param q: The second factor returned by the annealing
+    :return: The path of formulation.stats, "annealing" when p * q = n and "unsolved" otherwise
+    """
+    return "annealing" if int(p) * int(q) == n else "unsolved"
+
+
+def factorize(n, formulation, config=None, prepass=None):
+    """
+    Factor n classically within config.classical_budget, and solve the formulation only when this fails,
+    with the bounds of the smaller factor found by the classical search fixing bits of the model.
+    The path that solved n is recorded in formulation.stats, "unsolved" when the annealing returns a wrong pair,
+    with the classical time and the violated conditions of the safe semiprime precondition.
+    :param n: A composite integer
+    :param formulation: A Formulation
+    :param config: The RunConfig of the run
+    :param prepass: The result of classical_prepass for n when it already ran, such as in the parent of a batch
+    :return: A tuple of two integers factorized from n
+    """
+    config = config if config is not None else RunConfig()
+    if config.classical_budget is None:
+        p, q = formulation.solve(n, config=config)
+        formulation.stats["path"] = annealing_path(n, p, q)
+        return p, q
+
+    result = prepass if prepass is not None else classical_prepass(n, budget=config.classical_budget)
+    if result["issues"]:
+        logger.warning("%d is not a safe semiprime: %s", n, ", ".join(result["issues"]))
+    info = {"classical_time": result["time"], "issues": result["issues"]}
+    if result["factors"] is not None:
+        formulation.reset()
+        formulation.stats = dict(info, path=result["path"])
+        logger.info("Solved by %s in %.6fs: %d %d", result["path"], result["time"], *result["factors"])
+        return result["factors"]
+
+    logger.info("Classical search failed in %.6fs, p in [%d, %d]", result["time"], *result["bounds"])
+    config.factor_bounds = result["bounds"]
+    p, q = formulation.solve(n, config=config)
+    formulation.stats.update(info, path=annealing_path(n, p, q))
+    return p, q
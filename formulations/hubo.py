@@ -0,0 +1,177 @@
+import numpy as np
+
+INT64_MAX = np.iinfo(np.int64).max
+
+
+class PolyArray:
+    """
+    A pseudo-Boolean polynomial stored as integer-indexed arrays.
+    Each row of `indices` holds the sorted variable indices of one term, padded with -1 on the right,
+    and `coefs` holds the matching coefficients. The constant term is kept separately in `offset`.
+    Coefficients are int64 while they are guaranteed to fit, and Python integers (object dtype) otherwise.
+    """
+
+    def __init__(self, indices, coefs, offset=0):
+        self.indices = indices
+        self.coefs = coefs
+        self.offset = offset
+
+    def __len__(self):
+        return len(self.coefs)
+
+    @property
+    def degree(self):
+        if len(self) == 0:
+            return 0
+        return int((self.indices >= 0).sum(axis=1).max())
+
+    def max_coef(self):
+        if len(self) == 0:
+            return 0
+        return max(abs(coef) for coef in self.coefs.tolist())
+
+    @classmethod
+    def from_dict(cls, terms, offset=0):
+        """
+        Build the arrays from a dict of terms
+        :param terms: A dict mapping tuples of variable indices to coefficients
+        :param offset: The constant term
+        :return: A merged PolyArray
+        """
+        terms = dict(terms)
+        offset += terms.pop((), 0)
+        width = max([len(term) for term in terms], default=0)
+        indices = np.full((len(terms), width), -1, dtype=np.int64)
+        for row, term in enumerate(terms):
+            indices[row, :len(term)] = term
+        coefs = _coef_array(list(terms.values()))
+        return cls._normalize(indices, coefs, offset)
+
+    @classmethod
+    def from_arrays(cls, indices, coefs, offset=0):
+        """
+        Build the arrays from an unsorted index matrix, which may contain repeated variables and duplicated terms
+        :param indices: An integer matrix of variable indices, padded with -1
+        :param coefs: The coefficients of the rows
+        :param offset: The constant term
+        :return: A merged PolyArray
+        """
+        indices = np.asarray(indices, dtype=np.int64).reshape(len(coefs), -1)
+        if not isinstance(coefs, np.ndarray):
+            coefs = _coef_array(list(coefs))
+        return cls._normalize(indices, coefs, offset)
+
+    @classmethod
+    def concatenate(cls, polys):
+        """
+        Add up several polynomials
+        :param polys: A list of PolyArray
+        :return: A merged PolyArray
+        """
+        width = max([poly.indices.shape[1] for poly in polys], default=0)
+        indices = [np.pad(poly.indices, ((0, 0), (0, width - poly.indices.shape[1])), constant_values=-1)
+                   for poly in polys]
+        coefs = [poly.coefs for poly in polys]
+        if any(coef.dtype == object for coef in coefs):
+            coefs = [coef.astype(object) for coef in coefs]
+        offset = sum(poly.offset for poly in polys)
+        if len(polys) == 0:
+            return cls(np.empty((0, 0), dtype=np.int64), np.empty(0, dtype=np.int64), offset)
+        return cls._normalize(np.vstack(indices), np.concatenate(coefs), offset)
+
+    def to_dict(self):
+        """
+        Convert the arrays back to a dict of terms, leaving out the offset
+        :return: A dict mapping sorted tuples of variable indices to coefficients
+        """
+        terms = {}
+        degrees = (self.indices >= 0).sum(axis=1)
+        for deg in np.unique(degrees).tolist():
+            rows = degrees == deg
+            keys = map(tuple, self.indices[rows, :deg].tolist())
+            terms.update(zip(keys, self.coefs[rows].tolist()))
+        return terms
+
+    def scale(self, factor):
+        """
+        Multiply the polynomial by an integer
+        :param factor: An integer
+        :return: A PolyArray with the same terms
+        """
+        coefs = self.coefs
+        if coefs.dtype != object and abs(factor) * max(self.max_coef(), 1) > INT64_MAX:
+            coefs = coefs.astype(object)
+        return PolyArray(self.indices, coefs * factor, self.offset * factor)
+
+    def square(self):
+        """
+        Expand the square of the polynomial, using x^2 = x for binary variables.
+        Only the upper triangle of the term pairs is expanded, the off-diagonal products are doubled.
+        :return: A merged PolyArray
+        """
+        indices, coefs = self._with_offset()
+        left, right = np.triu_indices(len(coefs))
+        bound = int(sum(abs(coef) for coef in coefs.tolist())) ** 2
+        dtype = np.int64 if bound <= INT64_MAX else object
+        coefs = coefs.astype(dtype)
+        pair_coefs = coefs[left] * coefs[right]
+        pair_coefs[left != right] *= 2
+        pair_indices = np.concatenate([indices[left], indices[right]], axis=1)
+        return PolyArray._normalize(pair_indices, pair_coefs, 0)
+
+    def _with_offset(self):
+        """
+        :return: The indices and coefficients with the offset appended as an empty term
+        """
+        indices = np.vstack([self.indices, np.full((1, self.indices.shape[1]), -1, dtype=np.int64)])
+        coefs = np.concatenate([self.coefs, _coef_array([self.offset])])
+        return indices, coefs
+
+    @staticmethod
+    def _normalize(indices, coefs, offset):
+        """
+        Sort the variables inside each term, drop repeated variables and merge duplicated terms by a grouped sum
+        :return: A merged PolyArray
+        """
+        if indices.shape[1] == 0 or len(coefs) == 0:
+            offset += sum(coefs.tolist())
+            return PolyArray(np.empty((0, 0), dtype=np.int64), coefs[:0], offset)
+        indices = np.sort(np.where(indices < 0, INT64_MAX, indices), axis=1)
+        repeated = np.zeros(indices.shape, dtype=bool)
+        repeated[:, 1:] = indices[:, 1:] == indices[:, :-1]
+        indices[repeated] = INT64_MAX
+        indices = np.sort(indices, axis=1)
+        width = int((indices != INT64_MAX).sum(axis=1).max())
+        if width == 0:
+            offset += sum(coefs.tolist())
+            return PolyArray(np.empty((0, 0), dtype=np.int64), coefs[:0], offset)
+        indices = indices[:, :width]
+        indices[indices == INT64_MAX] = -1
+
+        # Pack each sorted row into a single integer key so the grouping is a 1-D sort
+        base = int(indices.max()) + 2
+        if base ** width <= INT64_MAX:
+            keys = np.zeros(len(indices), dtype=np.int64)
+            for col in range(width):
+                keys = keys * base + (indices[:, col] + 1)
+            _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            unique_indices = indices[first]
+        else:
+            unique_indices, inverse = np.unique(indices, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        merged = np.zeros(len(unique_indices), dtype=coefs.dtype)
+        np.add.at(merged, inverse, coefs)
+
+        is_constant = (unique_indices < 0).all(axis=1)
+        if is_constant.any():
+            offset += sum(merged[is_constant].tolist())
+        return PolyArray(unique_indices[~is_constant], merged[~is_constant], offset)
+
+
+def _coef_array(values):
+    """
+    :return: An int64 array of the values, or an object array if any of them overflows int64
+    """
+    if all(-INT64_MAX <= value <= INT64_MAX for value in values):
+        return np.array(values, dtype=np.int64)
+    return np.array(values, dtype=object)
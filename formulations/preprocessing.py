@@ -0,0 +1,89 @@
+from math import isqrt
+
+from dwave.preprocessing import roof_duality
+
+
+def factor_bit_fixings(n, l, known=None, bounds=None):
+    """
+    Derive bits of p and q from n alone. p and q are interchangeable, so one ordering is chosen to break the
+    symmetry, either p1 = 0, q1 = 1 when n = 3 mod 4, or p <= q which bounds the high bits.
+    The choice that fixes more bits is kept. The low bits are then propagated with p * q = n mod 2^(k + 1).
+    :param n: A safe semiprime
+    :param l: The number of bits of each factor
+    :param known: Bits already known, as a dict mapping ("x", i) to 0 or 1. No symmetry is broken when given.
+    :param bounds: The bounds (low, high) of the smaller factor found by classical_prepass, which narrow
+    the ranges of p and q when p <= q
+    :return: A dict mapping ("x", i) to 0 or 1, including the bits in known
+    """
+    if known is not None:
+        return _propagate(n, l, _split_bits(l, known))
+    high = min(n // 3, pow(2, l) - 1)
+    p_low, p_high = max(3, -(-n // high)), isqrt(n)
+    if bounds is not None:
+        p_low, p_high = max(p_low, bounds[0]), min(p_high, bounds[1])
+    p_bits = _range_bits(l, p_low, p_high)
+    q_bits = _range_bits(l, max(isqrt(n - 1) + 1, -(-n // p_high)), min(high, n // p_low))
+    candidates = [_propagate(n, l, (p_bits, q_bits))]
+    if n % 4 == 3:
+        candidates.append(_propagate(n, l, ({1: 0}, {1: 1})))
+    return max(candidates, key=len)
+
+
+def roof_duality_fixings(bqm):
+    """
+    Fix the variables that take the same value in every ground state of the BQM, using roof duality
+    :param bqm: A binary quadratic model
+    :return: A dict mapping the variables of the BQM to 0 or 1
+    """
+    if len(bqm.variables) == 0:
+        return {}
+    _, fixed = roof_duality(bqm, strict=True)
+    return fixed
+
+
+def _range_bits(l, low, high):
+    """
+    :return: The bits shared by every integer in [low, high], as a dict mapping bit positions to 0 or 1
+    """
+    if low > high:
+        return {}
+    bits = {}
+    for i in range(l - 1, 0, -1):
+        if (low >> i) != (high >> i):
+            break
+        bits[i] = (low >> i) & 1
+    return bits
+
+
+def _split_bits(l, known):
+    p_bits, q_bits = {}, {}
+    for (_, i), bit in known.items():
+        if i < l:
+            p_bits[i] = bit
+        else:
+            q_bits[i - l] = bit
+    return p_bits, q_bits
+
+
+def _propagate(n, l, bits):
+    """
+    Unit propagation of p_k xor q_k = bit k of (n - (p mod 2^k)(q mod 2^k)), which holds for odd p and q
+    while the lower k bits of both are known
+    :return: A dict mapping ("x", i) to 0 or 1
+    """
+    p_bits, q_bits = bits
+    p_bits[0] = q_bits[0] = 1
+    p_low = q_low = 1
+    for k in range(1, l):
+        parity = ((n - p_low * q_low) >> k) & 1
+        if k in p_bits and k not in q_bits:
+            q_bits[k] = p_bits[k] ^ parity
+        elif k in q_bits and k not in p_bits:
+            p_bits[k] = q_bits[k] ^ parity
+        elif k not in p_bits:
+            break
+        p_low += p_bits[k] << k
+        q_low += q_bits[k] << k
+    fixed = {("x", i): bit for i, bit in p_bits.items() if i > 0}
+    fixed.update({("x", j + l): bit for j, bit in q_bits.items() if j > 0})
+    return fixed
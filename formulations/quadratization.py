@@ -0,0 +1,243 @@
+from collections import Counter, defaultdict
+from functools import lru_cache
+from operator import itemgetter
+
+from .tracing import NULL_TRACER
+
+
+class Quadratization:
+    """
+    The base strategy for reducing HUBO terms to QUBO terms.
+    Auxiliary variables are allocated through the `new_var` callback given to `reduce`, so they are registered
+    in the variable map of the formulation that owns them.
+    """
+    name = None
+
+    def __init__(self) -> None:
+        self.aux_count = 0
+        self.max_coef = 0
+
+    def reduce(self, terms, offset=0, new_var=None, tracer=None):
+        """
+        Reduce every term of degree 3 or more
+        :param terms: A dict mapping tuples of variables to coefficients
+        :param offset: The offset of the energy
+        :param new_var: A function that allocates a new auxiliary variable and returns its index
+        :param tracer: The Tracer receiving a span for each reduction pass
+        :return: A dict of terms of degree at most 2 and the new offset
+        """
+        self.aux_count = 0
+        self.max_coef = 0
+        self._new_var = new_var
+        self._tracer = tracer if tracer is not None else NULL_TRACER
+        terms, offset = self._reduce(terms, offset)
+        terms, offset = _pop_constant(terms, offset)
+        self.max_coef = max([abs(coef) for coef in terms.values()], default=0)
+        return terms, offset
+
+    def report(self) -> dict:
+        """
+        :return: The statistics of the last reduction
+        """
+        return {
+            "strategy": self.name,
+            "aux_count": self.aux_count,
+            "max_coef": self.max_coef
+        }
+
+    def _reduce(self, terms, offset):
+        raise NotImplementedError
+
+    def _aux(self):
+        self.aux_count += 1
+        return self._new_var()
+
+
+class IshikawaQuadratization(Quadratization):
+    """
+    Reduce the last three variables of a term with one fresh auxiliary variable per term.
+    The formulation for optimization is: x1x2x3 = x3s + 2x1x2 - 4x1s - 4x2s + 6s
+    """
+    name = "ishikawa"
+
+    def _reduce(self, terms, offset):
+        max_deg = max([len(term) for term in terms], default=0)
+        for deg in range(max_deg, 2, -1):
+            with self._tracer.span("ishikawa_degree_" + str(deg)) as span:
+                aux_count = self.aux_count
+                opt_terms = defaultdict(int)
+                for term, coef in terms.items():
+                    if len(term) != deg:
+                        opt_terms[term] += coef
+                        continue
+                    new_terms, offset_mult = _ishikawa_template(deg, coef < 0)
+                    variables = term + (self._aux(),)
+                    for select, mult in new_terms:
+                        opt_terms[select(variables)] += mult * coef
+                    offset += offset_mult * coef
+                terms = dict(opt_terms)
+                span.count(num_terms=len(terms), aux_count=self.aux_count - aux_count)
+        return terms, offset
+
+
+class RosenbergQuadratization(Quadratization):
+    """
+    Substitute the first two variables of a term by w = x1x2, adding the penalty M(x1x2 - 2x1w - 2x2w + 3w).
+    Each pair of variables gets a single auxiliary variable shared by every term that contains it,
+    and M is one more than the sum of |coef| over the terms rewritten with it.
+    """
+    name = "rosenberg"
+
+    def _reduce(self, terms, offset):
+        self._pair_aux = {}
+        self._penalty = defaultdict(int)
+        with self._tracer.span("rosenberg_substitution") as span:
+            opt_terms = defaultdict(int)
+            for term, coef in terms.items():
+                term = tuple(sorted(term))
+                while len(term) > 2:
+                    aux = self._pair_aux_var(term[:2], coef)
+                    term = tuple(sorted(term[2:] + (aux,)))
+                opt_terms[term] += coef
+            span.count(num_terms=len(opt_terms), aux_count=self.aux_count)
+        return self._add_penalties(opt_terms), offset
+
+    def _pair_aux_var(self, pair, coef):
+        if pair not in self._pair_aux:
+            self._pair_aux[pair] = self._aux()
+        aux = self._pair_aux[pair]
+        self._penalty[aux] += abs(coef)
+        return aux
+
+    def _add_penalties(self, terms):
+        with self._tracer.span("rosenberg_penalties", num_pairs=len(self._pair_aux)):
+            for (x, y), aux in self._pair_aux.items():
+                weight = self._penalty[aux] + 1
+                for term, mult in _rosenberg_template():
+                    terms[tuple(sorted((x, y, aux)[p] for p in term))] += mult * weight
+        return dict(terms)
+
+
+class GreedyQuadratization(RosenbergQuadratization):
+    """
+    Rosenberg substitution that always picks the pair of variables shared by the most terms of degree 3 or more
+    """
+    name = "greedy"
+
+    def _reduce(self, terms, offset):
+        self._pair_aux = {}
+        self._penalty = defaultdict(int)
+        terms = defaultdict(int, {tuple(sorted(term)): coef for term, coef in terms.items()})
+        pair_terms = defaultdict(set)
+        pair_count = Counter()
+        for term in terms:
+            self._track(term, pair_terms, pair_count, 1)
+
+        with self._tracer.span("greedy_substitution") as span:
+            self._substitute(terms, pair_terms, pair_count)
+            span.count(num_terms=len(terms), aux_count=self.aux_count)
+        return self._add_penalties(terms), offset
+
+    def _substitute(self, terms, pair_terms, pair_count):
+        """
+        Substitute the most frequent pair until no term of degree 3 or more is left
+        """
+        while pair_count:
+            pair = max(pair_count, key=pair_count.get)
+            aux = None
+            for term in list(pair_terms[pair]):
+                coef = terms.pop(term)
+                self._track(term, pair_terms, pair_count, -1)
+                if aux is None:
+                    aux = self._pair_aux_var(pair, coef)
+                else:
+                    self._penalty[aux] += abs(coef)
+                new_term = tuple(sorted(tuple(v for v in term if v not in pair) + (aux,)))
+                if new_term not in terms:
+                    self._track(new_term, pair_terms, pair_count, 1)
+                terms[new_term] += coef
+
+    @staticmethod
+    def _track(term, pair_terms, pair_count, delta):
+        """
+        Add or remove the pairs of a term of degree 3 or more from the pair index
+        """
+        if len(term) <= 2:
+            return
+        for i in range(len(term)):
+            for j in range(i + 1, len(term)):
+                pair = (term[i], term[j])
+                if delta > 0:
+                    pair_terms[pair].add(term)
+                else:
+                    pair_terms[pair].discard(term)
+                pair_count[pair] += delta
+                if pair_count[pair] == 0:
+                    del pair_count[pair]
+                    del pair_terms[pair]
+
+
+QUADRATIZATIONS = {
+    IshikawaQuadratization.name: IshikawaQuadratization,
+    RosenbergQuadratization.name: RosenbergQuadratization,
+    GreedyQuadratization.name: GreedyQuadratization,
+}
+
+
+def get_quadratization(name="ishikawa") -> Quadratization:
+    """
+    :param name: The name of a registered strategy, or a Quadratization instance
+    :return: A Quadratization instance
+    """
+    if isinstance(name, Quadratization):
+        return name
+    if name not in QUADRATIZATIONS:
+        raise ValueError("Unknown quadratization {}, expected one of {}".format(name, list(QUADRATIZATIONS)))
+    return QUADRATIZATIONS[name]()
+
+
+@lru_cache(maxsize=None)
+def _ishikawa_template(deg, negative):
+    """
+    The reduction of a term of the given degree and sign, with the last three variables reduced.
+    Positions index the variables of the term, followed by the auxiliary variable at position `deg`.
+    :return: A tuple of (selector, multiplier) pairs and the multiplier of the offset,
+    where each selector picks the variables of a new term from the term plus its auxiliary variable
+    """
+    prefix = tuple(range(deg - 3))
+    x, y, z, w = (deg - 3,), (deg - 2,), (deg - 1,), (deg,)
+    if negative:
+        new_terms = {x + w: 1, y + w: 1, z + w: 1, w: -2}
+        new_offset = 0
+    else:
+        new_terms = {x + w: 1, y + w: 1, z + w: 1, w: -1, x + y: 1, y + z: 1, z + x: 1, x: -1, y: -1, z: -1}
+        new_offset = 1
+    new_terms = {prefix + term: mult for term, mult in new_terms.items()}
+    if deg > 3:
+        new_terms[prefix] = new_offset
+        new_offset = 0
+    return tuple((_selector(positions), mult) for positions, mult in new_terms.items()), new_offset
+
+
+@lru_cache(maxsize=None)
+def _rosenberg_template():
+    """
+    The penalty x1x2 - 2x1w - 2x2w + 3w over positions (x1, x2, w)
+    """
+    return ((0, 1), 1), ((0, 2), -2), ((1, 2), -2), ((2,), 3)
+
+
+def _selector(positions):
+    if len(positions) == 1:
+        position = positions[0]
+        return lambda variables: (variables[position],)
+    if len(positions) == 0:
+        return lambda variables: ()
+    return itemgetter(*positions)
+
+
+def _pop_constant(terms, offset):
+    if () in terms:
+        terms = dict(terms)
+        offset += terms.pop(())
+    return terms, offset
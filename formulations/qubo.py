@@ -0,0 +1,210 @@
+import numpy as np
+from dimod import BinaryQuadraticModel
+
+from .hubo import INT64_MAX, _coef_array
+
+# Integers up to 2^53 are exact in float64, the type of the biases and energies of a dimod BQM
+FLOAT64_EXACT_BITS = 53
+
+
+class SparseQubo:
+    """
+    A QUBO stored as integer COO arrays: row u and column v of each term with u <= v, a linear term of x
+    being the diagonal entry (x, x). The terms are sorted by (u, v) and merged, and zero terms are dropped.
+    Coefficients are int64 while they are guaranteed to fit, and Python integers (object dtype) otherwise,
+    so the QUBO stays exact however large n is. Precision is only lost on the conversion to a float64 BQM,
+    which check_precision detects and rescale bounds.
+    """
+
+    def __init__(self, rows, cols, coefs, num_variables=None):
+        self.rows = rows
+        self.cols = cols
+        self.coefs = coefs
+        if num_variables is None:
+            num_variables = int(cols.max()) + 1 if len(cols) > 0 else 0
+        self.num_variables = num_variables
+
+    def __len__(self):
+        return len(self.coefs)
+
+    @classmethod
+    def from_terms(cls, terms, num_variables=None):
+        """
+        :param terms: A dict mapping tuples of at most two variables to coefficients
+        :param num_variables: The number of variables of the model, including those absent from the terms
+        :return: A merged SparseQubo
+        """
+        rows = np.array([term[0] for term in terms], dtype=np.int64)
+        cols = np.array([term[-1] for term in terms], dtype=np.int64)
+        return cls._normalize(rows, cols, _coef_array(list(terms.values())), num_variables)
+
+    @classmethod
+    def from_dict(cls, q, num_variables=None):
+        """
+        :param q: A dict of QUBO terms, where a linear term of x is keyed by (x, x)
+        :param num_variables: The number of variables of the model
+        :return: A merged SparseQubo
+        """
+        return cls.from_terms(q, num_variables)
+
+    @classmethod
+    def from_poly(cls, poly, num_variables=None):
+        """
+        Take the terms of a PolyArray of degree at most 2 without going through a dict, leaving out the offset
+        :param poly: A PolyArray
+        :param num_variables: The number of variables of the model
+        :return: A merged SparseQubo
+        """
+        if poly.degree > 2:
+            raise ValueError("A QUBO holds terms of degree at most 2, got degree {}".format(poly.degree))
+        if len(poly) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return cls(empty, empty, poly.coefs[:0], num_variables)
+        rows = poly.indices[:, 0]
+        cols = poly.indices[:, 1] if poly.indices.shape[1] > 1 else rows
+        cols = np.where(cols < 0, rows, cols)
+        return cls._normalize(rows, cols, poly.coefs, num_variables)
+
+    @classmethod
+    def concatenate(cls, qubos, num_variables=None):
+        """
+        Add up several QUBOs
+        :param qubos: A list of SparseQubo
+        :param num_variables: The number of variables of the sum, the largest of the QUBOs when not given
+        :return: A merged SparseQubo
+        """
+        if num_variables is None:
+            num_variables = max([qubo.num_variables for qubo in qubos], default=0)
+        coefs = [qubo.coefs for qubo in qubos]
+        if any(coef.dtype == object for coef in coefs) or _sum_may_overflow(coefs):
+            coefs = [coef.astype(object) for coef in coefs]
+        if len(qubos) == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return cls(empty, empty, empty, num_variables)
+        return cls._normalize(np.concatenate([qubo.rows for qubo in qubos]),
+                              np.concatenate([qubo.cols for qubo in qubos]), np.concatenate(coefs), num_variables)
+
+    def scale(self, factor):
+        """
+        Multiply the QUBO by an integer
+        :param factor: An integer
+        :return: A SparseQubo with the same terms
+        """
+        coefs = self.coefs
+        if coefs.dtype != object and abs(factor) * max(self.max_coef(), 1) > INT64_MAX:
+            coefs = coefs.astype(object)
+        return SparseQubo(self.rows, self.cols, coefs * factor, self.num_variables)
+
+    def to_dict(self):
+        """
+        :return: A dict of QUBO terms with Python integer coefficients, where a linear term of x is keyed by (x, x)
+        """
+        return dict(zip(zip(self.rows.tolist(), self.cols.tolist()), self.coefs.tolist()))
+
+    def to_csr(self):
+        """
+        :return: The upper triangle as CSR arrays: the row pointers, the column of each term and its coefficient
+        """
+        indptr = np.zeros(self.num_variables + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.rows, minlength=self.num_variables), out=indptr[1:])
+        return indptr, self.cols, self.coefs
+
+    def max_coef(self):
+        if len(self) == 0:
+            return 0
+        return max(abs(coef) for coef in self.coefs.tolist())
+
+    def energy_bound(self):
+        """
+        :return: The sum of |coef|, which bounds |energy| of every sample and of every partial sum of its terms
+        """
+        return sum(abs(coef) for coef in self.coefs.tolist())
+
+    def check_precision(self):
+        """
+        Check that the BQM of the QUBO holds its coefficients and the energies of its samples exactly in float64
+        :return: A dict with the maximum |coef|, the energy bound, the number of bits they need and whether
+        the coefficients and the energies are exact
+        """
+        max_coef = self.max_coef()
+        energy_bound = self.energy_bound()
+        return {
+            "max_coef": max_coef,
+            "energy_bound": energy_bound,
+            "bits": int(energy_bound).bit_length(),
+            "exact_coefs": max_coef <= 2 ** FLOAT64_EXACT_BITS,
+            "exact": energy_bound <= 2 ** FLOAT64_EXACT_BITS,
+        }
+
+    def rescale(self, bits=FLOAT64_EXACT_BITS - 1):
+        """
+        Divide the coefficients by the smallest power of two that brings the energy bound under 2^bits,
+        rounding them to the nearest integer, so the scaled BQM is exact in float64.
+        Every energy of the scaled QUBO, multiplied by the scale, is within max_error of the exact one.
+        The energies of the exact QUBO are integers, so its ordering is kept when max_error < 1 / 2.
+        :param bits: The number of bits of the scaled energy bound
+        :return: The scaled SparseQubo and a dict with the scale, max_error and whether the ordering is kept
+        """
+        shift = max(0, int(self.energy_bound()).bit_length() - bits)
+        if shift == 0:
+            return self, {"scale": 1, "max_error": 0, "ordering_kept": True}
+        # Round half up without the overflow of adding 2^(shift - 1) first
+        coefs = (self.coefs >> shift) + ((self.coefs >> (shift - 1)) & 1)
+        if coefs.dtype == object and max([abs(coef) for coef in coefs.tolist()], default=0) <= INT64_MAX:
+            coefs = coefs.astype(np.int64)
+        max_error = sum(abs(coef - (scaled << shift)) for coef, scaled in zip(self.coefs.tolist(), coefs.tolist()))
+        scaled = SparseQubo._normalize(self.rows, self.cols, coefs, self.num_variables)
+        return scaled, {"scale": 2 ** shift, "max_error": max_error, "ordering_kept": 2 * max_error < 1}
+
+    def to_bqm(self):
+        """
+        Build the BQM from the arrays with from_numpy_vectors, with a variable for every index below num_variables
+        :return: A dimod.BinaryQuadraticModel whose biases are the coefficients in float64
+        """
+        diagonal = self.rows == self.cols
+        linear = np.zeros(self.num_variables, dtype=np.float64)
+        linear[self.rows[diagonal]] = self.coefs[diagonal].astype(np.float64)
+        quadratic = (self.rows[~diagonal], self.cols[~diagonal], self.coefs[~diagonal].astype(np.float64))
+        return BinaryQuadraticModel.from_numpy_vectors(linear, quadratic, 0.0, "BINARY")
+
+    def energies(self, samples):
+        """
+        Compute the energies of samples exactly, in int64 when the energy bound fits and in Python integers otherwise
+        :param samples: A binary matrix with one row per sample and one column per variable index
+        :return: An array of the energies
+        """
+        samples = np.asarray(samples, dtype=bool)
+        dtype = np.int64 if self.energy_bound() <= INT64_MAX else object
+        coefs = self.coefs.astype(dtype)
+        energies = np.zeros(len(samples), dtype=dtype)
+        chunk = max(1, 2 ** 22 // max(len(self), 1))
+        for start in range(0, len(samples), chunk):
+            block = samples[start:start + chunk]
+            active = block[:, self.rows] & block[:, self.cols]
+            energies[start:start + chunk] = active.astype(dtype) @ coefs
+        return energies
+
+    @staticmethod
+    def _normalize(rows, cols, coefs, num_variables=None):
+        """
+        Put each term in the upper triangle, merge duplicated terms by a grouped sum and drop the zero terms
+        :return: A merged SparseQubo
+        """
+        rows, cols = np.minimum(rows, cols).astype(np.int64), np.maximum(rows, cols).astype(np.int64)
+        if num_variables is None:
+            num_variables = int(cols.max()) + 1 if len(cols) > 0 else 0
+        keys = rows * max(num_variables, 1) + cols
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        merged = np.zeros(len(unique_keys), dtype=coefs.dtype)
+        np.add.at(merged, inverse.reshape(-1), coefs)
+        nonzero = merged != 0
+        unique_keys = unique_keys[nonzero]
+        rows, cols = np.divmod(unique_keys, max(num_variables, 1))
+        return SparseQubo(rows, cols, merged[nonzero], num_variables)
+
+
+def _sum_may_overflow(coefs):
+    """
+    :return: True if the sum of |coef| over the int64 arrays may exceed int64, estimated in float64
+    """
+    return sum(float(np.abs(coef.astype(np.float64)).sum()) for coef in coefs) > INT64_MAX / 2
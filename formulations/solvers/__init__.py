@@ -1,3 +1,35 @@
-from .solve_bqm import solve_simulated_annealing, solve_quantum_annealing
+import importlib
 
-__all__ = ["solve_simulated_annealing", "solve_quantum_annealing"]
\ No newline at end of file
+from .registry import SolverRegistry
+
+SOLVERS = SolverRegistry(__name__, {
+    "qa": (".solve_bqm", "solve_quantum_annealing"),
+    "sa": (".solve_bqm", "solve_simulated_annealing"),
+    "psa": (".solve_bqm", "solve_parallel_annealing"),
+    "decomp": (".decomposition", "solve_decomposition"),
+})
+
+# The module of each export, imported on first access so that importing the package stays fast
+_EXPORTS = {
+    "solve_simulated_annealing": ".solve_bqm",
+    "solve_quantum_annealing": ".solve_bqm",
+    "solve_parallel_annealing": ".solve_bqm",
+    "solve_streaming": ".streaming",
+    "solve_decomposition": ".decomposition",
+    "ParallelAnnealingSampler": ".parallel_sa",
+    "MockQPUSampler": ".mock_qpu",
+    "DecompositionSampler": ".decomposition",
+}
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+__all__ = ["solve_simulated_annealing", "solve_quantum_annealing", "solve_parallel_annealing", "solve_streaming",
+           "solve_decomposition", "SOLVERS", "SolverRegistry", "ParallelAnnealingSampler", "MockQPUSampler",
+           "DecompositionSampler"]
@@ -0,0 +1,81 @@
+import dimod
+import numpy as np
+
+
+class CSRModel:
+    """
+    A binary quadratic model in BINARY form with its symmetric adjacency stored as CSR arrays.
+    Nothing dense over the variables is built, so the model is O(number of interactions) in memory, scales to
+    models far larger than a QPU can embed and is cheap to send to worker processes.
+    """
+
+    def __init__(self, bqm) -> None:
+        self.variables = list(bqm.variables)
+        self.vartype = bqm.vartype
+        binary = bqm if bqm.vartype is dimod.BINARY else bqm.change_vartype(dimod.BINARY, inplace=False)
+        num_vars = len(self.variables)
+        linear, (rows, cols, biases), offset = binary.to_numpy_vectors(variable_order=self.variables)
+        self.linear = linear.astype(np.float64)
+        self.offset = float(offset)
+        rows, cols = np.concatenate([rows, cols]).astype(np.int64), np.concatenate([cols, rows]).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        self.indices = cols[order]
+        self.data = np.concatenate([biases, biases]).astype(np.float64)[order]
+        self.indptr = np.zeros(num_vars + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=num_vars), out=self.indptr[1:])
+
+        # Fields are exact in float32 while they stay within its 24-bit mantissa
+        max_field = np.abs(self.linear).max(initial=0) + np.abs(self.data).sum()
+        self.dtype = np.float32 if max_field < pow(2, 24) and np.all(self.data == np.round(self.data)) else np.float64
+
+    def __len__(self):
+        return len(self.variables)
+
+    def rows(self):
+        """
+        :return: The row of each entry of the CSR arrays
+        """
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+    def plan(self, variables):
+        """
+        Gather the CSR rows of some variables into contiguous segments, so their fields are a single
+        np.add.reduceat over the products of the couplings and the states of the neighbours
+        :param variables: An array of variables
+        :return: A tuple of the variables, the neighbour and the coupling of each entry of their rows,
+        the start of each non-empty row and the mask of the variables with a non-empty row
+        """
+        starts = self.indptr[variables]
+        counts = self.indptr[variables + 1] - starts
+        positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        nonempty = counts > 0
+        segments = (np.cumsum(counts) - counts)[nonempty]
+        return variables, self.indices[positions], self.data[positions].astype(self.dtype), segments, nonempty
+
+    def fields(self, states, plan=None, clamped=None):
+        """
+        :param states: A matrix of states, one row per read
+        :param plan: The result of plan for the variables to compute, all of them by default
+        :param clamped: A boolean mask of the neighbours to count, all of them by default
+        :return: The local field h_i + sum_j J_ij x_j of each variable, one row per read
+        """
+        variables, nbrs, data, segments, nonempty = plan if plan is not None else self.plan(np.arange(len(self)))
+        if clamped is not None:
+            data = data * clamped[nbrs]
+        fields = np.tile(self.linear[variables].astype(self.dtype), (len(states), 1))
+        if len(nbrs) == 0:
+            return fields
+        # Bound the gathered products to 2^22 entries
+        chunk = max(1, pow(2, 22) // len(nbrs))
+        for start in range(0, len(states), chunk):
+            contributions = states[start:start + chunk, nbrs] * data
+            fields[start:start + chunk, nonempty] += np.add.reduceat(contributions, segments, axis=1)
+        return fields
+
+    def energies(self, states):
+        """
+        :return: The energy of each state, with the offset of the BQM
+        """
+        linear = states @ self.linear
+        quadratic = 0.5 * (states * (self.fields(states) - self.linear)).sum(axis=1, dtype=np.float64)
+        return linear + quadratic + self.offset
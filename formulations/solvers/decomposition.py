@@ -0,0 +1,383 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import dimod
+import numpy as np
+from dwave.samplers import SteepestDescentSolver
+
+from ..config import RunConfig
+from .csr import CSRModel
+from .embedding_cache import EmbeddingCache
+from .solve_bqm import qpu_child, qpu_parameters
+
+SELECTIONS = ("energy", "bits")
+
+
+class Adjacency(CSRModel):
+    """
+    The CSRModel of a decomposition, with the selection of connected subsets and their restriction to subproblems.
+    The BINARY BQM is kept for the steepest descent over the whole model.
+    """
+
+    def __init__(self, bqm) -> None:
+        super().__init__(bqm)
+        self.bqm = bqm if bqm.vartype is dimod.BINARY else bqm.change_vartype(dimod.BINARY, inplace=False)
+
+    def grow(self, ranking, size, available):
+        """
+        Select a connected subset breadth first, from the best ranked available variable, visiting the neighbours
+        in ranking order, and from the next best one whenever the component is exhausted
+        :param ranking: The variables, best first
+        :param size: The number of variables to select
+        :param available: A boolean mask of the variables that may be selected, updated in place
+        :return: An array of the selected variables
+        """
+        rank = np.empty(len(self), dtype=np.int64)
+        rank[ranking] = np.arange(len(ranking))
+        selected = []
+        queued = set()
+        for seed in ranking:
+            if len(selected) >= size:
+                break
+            if not available[seed]:
+                continue
+            queue = [seed]
+            queued.add(seed)
+            while queue and len(selected) < size:
+                v = queue.pop(0)
+                selected.append(v)
+                available[v] = False
+                nbrs = self.indices[self.indptr[v]:self.indptr[v + 1]]
+                nbrs = nbrs[available[nbrs]]
+                for u in nbrs[np.argsort(rank[nbrs], kind="stable")].tolist():
+                    if u not in queued:
+                        queued.add(u)
+                        queue.append(u)
+        return np.sort(np.array(selected, dtype=np.int64))
+
+    def subproblem(self, variables, states):
+        """
+        Restrict the model to some variables, the others being clamped to their values in each state
+        :param variables: An array of variables
+        :param states: A matrix of states, one row per read
+        :return: The symmetric coupling matrix between the variables, and their linear biases in each state
+        """
+        inside = np.zeros(len(self), dtype=bool)
+        inside[variables] = True
+        position = np.full(len(self), -1, dtype=np.int64)
+        position[variables] = np.arange(len(variables))
+        coupling = np.zeros((len(variables), len(variables)))
+        for row, v in enumerate(variables):
+            nbrs = self.indices[self.indptr[v]:self.indptr[v + 1]]
+            data = self.data[self.indptr[v]:self.indptr[v + 1]]
+            coupling[row, position[nbrs[inside[nbrs]]]] = data[inside[nbrs]]
+        return coupling, self.fields(states, self.plan(variables), clamped=~inside)
+
+
+def anneal_subproblem(coupling, linear, states, seed=None, num_sweeps=100, beta_range=None):
+    """
+    Simulated annealing of one subproblem in every read at once, one variable at a time in random order
+    :param coupling: The symmetric coupling matrix of the subproblem
+    :param linear: The linear biases of the subproblem, one row per read
+    :param states: The current states of the subproblem, one row per read
+    :param seed: The seed of the random generator
+    :param num_sweeps: The number of sweeps
+    :param beta_range: The (hot, cold) inverse temperatures, derived from the biases by default
+    :return: The final states, one row per read
+    """
+    rng = np.random.default_rng(seed)
+    states = states.copy()
+    if beta_range is None:
+        max_field = np.abs(linear).max(initial=0) + np.abs(coupling).sum(axis=0).max(initial=0)
+        coefs = np.abs(np.concatenate([linear.ravel(), coupling.ravel()]))
+        coefs = coefs[coefs > 0]
+        if len(coefs) == 0:
+            return states
+        beta_range = np.log(2) / max_field, np.log(100) / coefs.min()
+    fields = linear + states @ coupling
+    for beta in np.geomspace(beta_range[0], beta_range[1], num_sweeps):
+        for i in rng.permutation(states.shape[1]):
+            delta = (1 - 2 * states[:, i]) * fields[:, i]
+            flip = rng.random(len(states)) < np.exp(-np.clip(beta * delta, 0, 80))
+            if flip.any():
+                change = np.where(flip, 1 - 2 * states[:, i], 0)
+                states[flip, i] ^= 1
+                fields += change[:, None] * coupling[i]
+    return states
+
+
+class QPUSubproblemSampler:
+    """
+    Sample subproblems on a structured sampler, the QPU or its mock stand-in.
+    Each subproblem is embedded once per graph, through the embedding cache, and only the problems of the
+    num_problems best incumbents are submitted. Every read then takes the best of all the returned samples under
+    its own clamped fields, so the QPU spend of an iteration does not grow with the number of reads.
+    Variables without a coupling inside the subproblem are set to their best value classically.
+    """
+
+    def __init__(self, qpu, target_edgelist, num_reads=10, num_problems=1, cache=None, chain_strength_prefactor=0.25,
+                 annealing_time=200, anneal_schedule_id=-1) -> None:
+        """
+        :param qpu: A structured sampler
+        :param target_edgelist: The edges of its graph
+        :param num_reads: The number of samples of each submitted problem
+        :param num_problems: The number of problems submitted for each subproblem, for the first reads given,
+        which DecompositionSampler orders best first
+        :param cache: An EmbeddingCache, or None to keep the embeddings of the run in memory only
+        :param chain_strength_prefactor: The prefactor of uniform_torque_compensation
+        :param annealing_time: The annealing time in microseconds, used when anneal_schedule_id is -1
+        :param anneal_schedule_id: A key of SCHEDULES, or -1 for a plain anneal of annealing_time
+        """
+        self.qpu = qpu
+        self.target_edgelist = target_edgelist
+        self.num_reads = num_reads
+        self.num_problems = num_problems
+        self.cache = cache
+        self.chain_strength_prefactor = chain_strength_prefactor
+        self.annealing_time = annealing_time
+        self.anneal_schedule_id = anneal_schedule_id
+        self.embeddings = {}
+        self.num_submitted = 0
+
+    def embed(self, edgelist, seed=None):
+        """
+        :param edgelist: The edges of the subproblem, between positions in the subproblem
+        :param seed: The seed of minorminer
+        :return: The embedding of the subproblem, from memory, from the cache or found with minorminer
+        """
+        key = tuple(edgelist)
+        if key not in self.embeddings:
+            embedding = self.cache.get(edgelist, self.target_edgelist) if self.cache is not None else None
+            if embedding is None:
+                from minorminer import minorminer
+
+                embedding = minorminer.find_embedding(edgelist, self.target_edgelist, random_seed=seed)
+                if embedding and self.cache is not None:
+                    self.cache.put(edgelist, self.target_edgelist, embedding)
+            else:
+                embedding = {int(v): qubits for v, qubits in embedding.items()}
+            self.embeddings[key] = embedding
+        return self.embeddings[key]
+
+    def __call__(self, coupling, linear, states, seed=None):
+        states = states.copy()
+        rows, cols = np.nonzero(np.triu(coupling, 1))
+        coupled = np.unique(np.concatenate([rows, cols]))
+        isolated = np.setdiff1d(np.arange(states.shape[1]), coupled)
+        states[:, isolated] = linear[:, isolated] < 0
+        if len(coupled) == 0:
+            return states
+        embedding = self.embed(list(zip(rows.tolist(), cols.tolist())), seed=seed)
+        if not embedding:
+            return states
+        from dwave.system import FixedEmbeddingComposite
+
+        sampler = FixedEmbeddingComposite(self.qpu, embedding=embedding)
+        candidates = []
+        for read in range(min(self.num_problems, len(states))):
+            bqm = dimod.BinaryQuadraticModel.from_numpy_vectors(
+                linear[read, coupled], (np.searchsorted(coupled, rows), np.searchsorted(coupled, cols),
+                                        coupling[rows, cols]), 0.0, "BINARY")
+            bqm.relabel_variables(dict(enumerate(coupled.tolist())))
+            parameters, _ = qpu_parameters(bqm, chain_strength_prefactor=self.chain_strength_prefactor,
+                                           annealing_time=self.annealing_time,
+                                           anneal_schedule_id=self.anneal_schedule_id)
+            response = sampler.sample(bqm, num_reads=self.num_reads, **parameters)
+            self.num_submitted += 1
+            columns = {v: i for i, v in enumerate(response.variables)}
+            candidates.append(response.record.sample[:, [columns[v] for v in coupled.tolist()]])
+
+        # Every read takes the sample of lowest energy under its own fields, or keeps its state when it is lower
+        candidates = np.vstack(candidates).astype(np.float64)
+        inner = coupling[np.ix_(coupled, coupled)]
+        quadratic = 0.5 * ((candidates @ inner) * candidates).sum(axis=1)
+        energies = linear[:, coupled] @ candidates.T + quadratic
+        current = (linear[:, coupled] * states[:, coupled]).sum(axis=1) + \
+            0.5 * ((states[:, coupled] @ inner) * states[:, coupled]).sum(axis=1)
+        best = energies.argmin(axis=1)
+        better = energies[np.arange(len(states)), best] < current
+        states[np.ix_(better, coupled)] = candidates[best[better]]
+        return states
+
+
+class DecompositionSampler(dimod.Sampler):
+    """
+    A qbsolv-style large neighbourhood search. Every read keeps an incumbent state, polished by steepest descent.
+    Each iteration grows disjoint connected subsets of variables from those of highest energy impact, or of
+    highest priority such as the bit position of p and q, samples each subset with the others clamped,
+    in parallel, and keeps the result in the reads where it lowers the energy. The selected variables are tabu
+    for the next iterations, so the subsets roll over the whole model.
+    """
+    parameters = {"num_reads": [], "subproblem_size": [], "selection": [], "priority": [], "max_iterations": [],
+                  "patience": [], "num_sweeps": [], "beta_range": [], "subsolver": [], "workers": [], "seed": []}
+    properties = {"selections": list(SELECTIONS)}
+
+    def sample(self, bqm, num_reads=10, subproblem_size=64, selection="energy", priority=None, max_iterations=50,
+               patience=10, num_sweeps=100, beta_range=None, subsolver=None, workers=None, seed=None, **kwargs):
+        """
+        :param bqm: A binary quadratic model
+        :param num_reads: The number of incumbent states, each one returned as a sample
+        :param subproblem_size: The number of variables of each subproblem
+        :param selection: energy to select the variables of highest energy impact, bits to select the variables
+        of highest priority first
+        :param priority: A dict mapping variables to their priority, for the bits selection
+        :param max_iterations: The maximum number of iterations
+        :param patience: Stop after this many iterations without a lower energy
+        :param num_sweeps: The number of sweeps of the simulated annealing of the subproblems
+        :param beta_range: The (hot, cold) inverse temperatures of the subproblems, derived from the biases by default
+        :param subsolver: A function of the coupling matrix, the linear biases, the states and a seed returning
+        new states, such as a QPUSubproblemSampler. Simulated annealing in worker processes when None,
+        otherwise called from threads.
+        :param workers: The number of subproblems solved at the same time, defaults to the number of CPUs
+        :param seed: The seed of the random generators
+        :return: A dimod.SampleSet
+        """
+        if selection not in SELECTIONS:
+            raise ValueError("Unknown selection {}, expected one of {}".format(selection, list(SELECTIONS)))
+        model = Adjacency(bqm)
+        rng = np.random.default_rng(seed)
+        workers = workers or os.cpu_count() or 1
+        info = {"iterations": 0, "num_subproblems": 0, "num_accepted": 0, "energy_trace": []}
+        states = self._polish(model, rng.integers(0, 2, size=(num_reads, len(model)), dtype=np.int8))
+        energies = model.energies(states)
+        if len(model) == 0:
+            return self._sampleset(bqm, model, states, info)
+
+        size = min(subproblem_size, len(model))
+        num_parts = max(1, min(workers, len(model) // size))
+        tenure = max(0, len(model) // (size * num_parts) - 1)
+        tabu = np.zeros(len(model), dtype=np.int64)
+        ranks = np.zeros(len(model))
+        if selection == "bits" and priority is not None:
+            ranks = np.array([priority.get(v, 0) for v in model.variables], dtype=np.float64)
+        if subsolver is None:
+            subsolver = partial(anneal_subproblem, num_sweeps=num_sweeps, beta_range=beta_range)
+            executor = ProcessPoolExecutor(max_workers=workers) if num_parts > 1 else None
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers) if num_parts > 1 else None
+
+        best = energies.min()
+        stalled = 0
+        try:
+            for iteration in range(max_iterations):
+                # Order the reads best first, so a subsolver with a budget spends it on the best incumbents
+                order = np.argsort(energies, kind="stable")
+                states, energies = states[order], energies[order]
+                fields = model.fields(states)
+                impact = np.abs((1 - 2 * states) * fields).mean(axis=0)
+                eligible = tabu <= iteration
+                if eligible.sum() < size * num_parts:
+                    eligible[:] = True
+                ranking = np.lexsort((-impact, -ranks))
+                parts = [model.grow(ranking, size, eligible) for _ in range(num_parts)]
+                parts = [part for part in parts if len(part) > 0]
+                for part in parts:
+                    tabu[part] = iteration + 1 + tenure
+
+                jobs = []
+                for part in parts:
+                    coupling, linear = model.subproblem(part, states)
+                    jobs.append((coupling, linear, states[:, part], int(rng.integers(2 ** 31))))
+                if executor is None:
+                    results = [subsolver(*job) for job in jobs]
+                else:
+                    results = list(executor.map(subsolver, *zip(*jobs)))
+
+                # Merge the subproblems one by one, keeping each one in the reads it improves
+                for part, substates in zip(parts, results):
+                    candidate = states.copy()
+                    candidate[:, part] = substates
+                    candidate_energies = model.energies(candidate)
+                    better = candidate_energies < energies
+                    states[better] = candidate[better]
+                    energies[better] = candidate_energies[better]
+                    info["num_accepted"] += int(better.sum())
+                info["num_subproblems"] += len(parts)
+
+                states = self._polish(model, states)
+                energies = model.energies(states)
+                info["iterations"] = iteration + 1
+                info["energy_trace"].append(float(energies.min()))
+                if energies.min() < best:
+                    best = energies.min()
+                    stalled = 0
+                else:
+                    stalled += 1
+                    if stalled >= patience:
+                        break
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self._sampleset(bqm, model, states, info)
+
+    @staticmethod
+    def _polish(model, states):
+        """
+        :return: The states after a steepest descent on the whole model
+        """
+        if len(model) == 0:
+            return states
+        response = SteepestDescentSolver().sample(model.bqm, initial_states=(states, model.variables))
+        columns = {v: i for i, v in enumerate(response.variables)}
+        return response.record.sample[:, [columns[v] for v in model.variables]].astype(np.int8)
+
+    @staticmethod
+    def _sampleset(bqm, model, states, info):
+        if bqm.vartype is dimod.SPIN:
+            states = 2 * states - 1
+        return dimod.SampleSet.from_samples_bqm((states, model.variables), bqm, info=info)
+
+
+def decomposition_parameters(config):
+    """
+    :param config: The RunConfig of the run
+    :return: The keyword arguments of DecompositionSampler.sample for the run, besides num_reads
+    """
+    parameters = {
+        "subproblem_size": config.subproblem_size,
+        "selection": config.selection,
+        "priority": config.variable_priority,
+        "max_iterations": config.max_iterations,
+        "num_sweeps": config.num_sweeps,
+        "beta_range": config.beta_range,
+        "workers": config.workers,
+    }
+    if config.subsolver == "qa":
+        qpu, target_edgelist = qpu_child(config)
+        cache = EmbeddingCache(config.embedding_cache_dir) if config.embedding_cache_dir else None
+        parameters["subsolver"] = QPUSubproblemSampler(qpu, target_edgelist, num_problems=config.subproblem_submissions,
+                                                       cache=cache,
+                                                       chain_strength_prefactor=config.chain_strength_prefactor,
+                                                       annealing_time=config.annealing_time,
+                                                       anneal_schedule_id=config.anneal_schedule_id)
+    return parameters
+
+
+def solve_decomposition(bqm, method="?_", num_reads=1000, config=None):
+    config = config if config is not None else RunConfig()
+    sampler = DecompositionSampler()
+    solver_config = method + str(num_reads) + "-DC" + config.subsolver + "k" + str(
+        config.subproblem_size) + config.selection + "i" + str(config.max_iterations)
+    config.solver_config = solver_config
+    start = time.time()
+    parameters = decomposition_parameters(config)
+    response = sampler.sample(bqm, num_reads=num_reads, **parameters)
+    end = time.time()
+    config_dict = {
+        "config": solver_config,
+        "num_vars": len(bqm.variables),
+        "time_elapsed": end - start,
+        "subproblem_size": config.subproblem_size,
+        "selection": config.selection,
+        "subsolver": config.subsolver,
+        "iterations": response.info["iterations"],
+        "num_subproblems": response.info["num_subproblems"],
+        "num_accepted": response.info["num_accepted"],
+        "energy_trace": response.info["energy_trace"],
+    }
+    if "subsolver" in parameters:
+        config_dict["qpu_submissions"] = parameters["subsolver"].num_submitted
+    config.write_report("_1", config_dict)
+    return response
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+
+def source_edgelist(bqm):
+    """
+    :return: The interaction graph of the BQM, with a self-loop for every variable so isolated ones are kept
+    """
+    return list(chain(bqm.quadratic, ((v, v) for v in bqm.linear)))
+
+
+def graph_hash(edgelist):
+    """
+    Hash a graph independently of the order of its edges and of the endpoints of each edge
+    :param edgelist: A list of pairs of node labels
+    :return: A hex digest
+    """
+    edges = sorted(set(tuple(sorted((repr(u), repr(v)))) for u, v in edgelist))
+    return hashlib.sha256(json.dumps(edges).encode()).hexdigest()
+
+
+def generate_target_graph(topology="pegasus", size=16, output=None):
+    """
+    Generate the working graph of an ideal QPU, so embeddings can be searched without network access
+    :param topology: pegasus or zephyr
+    :param size: The size parameter of the topology, 16 for Advantage, 6 for Advantage2 prototypes
+    :param output: A JSON file to save the graph to
+    :return: The list of edges
+    """
+    import dwave_networkx as dnx
+    generators = {"pegasus": dnx.pegasus_graph, "zephyr": dnx.zephyr_graph}
+    graph = generators[topology](size)
+    edgelist = [list(edge) for edge in graph.edges]
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump({"topology": {"type": topology, "shape": [size]}, "nodes": list(graph.nodes),
+                       "edges": edgelist}, f)
+    return edgelist
+
+
+def load_target_graph(path):
+    """
+    Load a target graph saved by generate_target_graph, or a plain JSON list of edges
+    :param path: A JSON file
+    :return: The list of edges
+    """
+    with open(path, "r") as f:
+        graph = json.load(f)
+    if isinstance(graph, dict):
+        graph = graph["edges"]
+    return [tuple(edge) for edge in graph]
+
+
+class EmbeddingCache:
+    """
+    An on-disk cache of embeddings keyed by the hashes of the source and the target graphs.
+    Each entry is a JSON file; the modification time of an entry is refreshed on every hit, and the least
+    recently used entries are evicted once the cache holds more than max_entries or max_bytes.
+    """
+
+    def __init__(self, directory="output/.embeddings", max_entries=256, max_bytes=256 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._executor = None
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def key(self, source, target) -> str:
+        """
+        :param source: The source edge list, or a BQM
+        :param target: The target edge list
+        :return: The key of the entry
+        """
+        if hasattr(source, "quadratic"):
+            source = source_edgelist(source)
+        return graph_hash(source)[:32] + "-" + graph_hash(target)[:16]
+
+    def get(self, source, target):
+        """
+        :return: The cached embedding, or None
+        """
+        path = self._path(self.key(source, target))
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return {v: qubits for v, qubits in entry["embedding"]}
+
+    def put(self, source, target, embedding) -> None:
+        """
+        Store an embedding, replacing the entry atomically so concurrent readers never see a partial file
+        """
+        entry = {"embedding": [[v, list(qubits)] for v, qubits in embedding.items()]}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._path(self.key(source, target)))
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Remove the least recently used entries until the cache fits its caps
+        :return: The number of entries removed
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, name = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total_bytes -= size
+            removed += 1
+        return removed
+
+    def warm(self, bqm, target, num_seeds=None, workers=None, timeout=30):
+        """
+        Search an embedding in the background and store it, unless one is cached already.
+        The searches of a cache run one after the other, in the order they were requested.
+        :param bqm: The binary quadratic model
+        :param target: The target edge list
+        :param num_seeds: The number of minorminer seeds tried in parallel, one per CPU by default
+        :param workers: The number of worker processes
+        :param timeout: The timeout of each minorminer attempt in seconds
+        :return: A future resolving to the embedding
+        """
+        from .export_embedding import find_best_embedding
+        num_seeds = num_seeds or os.cpu_count() or 1
+        source = source_edgelist(bqm)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+        def search():
+            embedding = self.get(source, target)
+            if embedding is None:
+                embedding = find_best_embedding(source, target, num_seeds=num_seeds, workers=workers,
+                                                timeout=timeout)
+                if embedding is not None:
+                    self.put(source, target, embedding)
+            return embedding
+
+        return self._executor.submit(search)
+
+    def _path(self, key) -> str:
+        return os.path.join(self.directory, key + ".json")
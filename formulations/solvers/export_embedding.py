@@ -1,4 +1,6 @@
 import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
 from itertools import chain
 from dimod import child_structure_dfs
 from dwave.embedding import EmbeddedStructure
@@ -6,50 +8,68 @@ from dwave.system import DWaveSampler
 from minorminer import minorminer
 from minorminer.utils import DisconnectedChainError
 
+logger = logging.getLogger(__name__)
 
-def get_embedding(bqm, output):
+
+def _embed_seed(args):
+    """
+    Run minorminer with a single seed, in a worker process
+    :return: The seed and the embedding, empty if it failed or has a disconnected chain
+    """
+    source_edgelist, target_edgelist, seed, timeout = args
+    embedding = minorminer.find_embedding(source_edgelist, target_edgelist, max_no_improvement=20,
+                                          random_seed=seed, chainlength_patience=20, timeout=timeout)
+    if len(embedding.keys()) == 0:
+        return seed, {}
+    try:
+        EmbeddedStructure(target_edgelist, embedding)
+    except DisconnectedChainError:
+        return seed, {}
+    return seed, {v: list(qubits) for v, qubits in embedding.items()}
+
+
+def find_best_embedding(source_edgelist, target_edgelist, num_seeds=50, workers=None, timeout=300,
+                        max_rounds=10):
+    """
+    Run minorminer with num_seeds seeds in parallel and keep the embedding with the shortest longest chain,
+    then the fewest qubits. Another round of seeds is tried while none succeeded.
+    :param source_edgelist: The edges of the problem graph
+    :param target_edgelist: The edges of the QPU graph
+    :param num_seeds: The number of seeds of each round
+    :param workers: The number of worker processes, defaults to the number of CPUs
+    :param timeout: The timeout of each minorminer attempt in seconds
+    :param max_rounds: The number of rounds before giving up
+    :return: The best embedding, or None
+    """
     best_embedding = None
-    source_edgelist = list(chain(bqm.quadratic, ((int(v), int(v)) for v in bqm.linear)))
-    target_edgelist = child_structure_dfs(DWaveSampler()).edgelist
-    min_val = 1e9
     min_len = 1e5
-    trials = 0
-    found = False
-    while trials < 50 or not found:
-        trials += 1
-        embedding = minorminer.find_embedding(source_edgelist, target_edgelist, verbose=2, max_no_improvement=20,
-                                              random_seed=trials, chainlength_patience=20, timeout=300)
-        if len(embedding.keys()) == 0:
-            print("Failed", trials)
-            continue
-
-        try:
-            embed_structure = EmbeddedStructure(target_edgelist, embedding)
-        except DisconnectedChainError:
-            print("Failed", trials)
-            continue
-        found = True
+    min_val = 1e9
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for round_id in range(max_rounds):
+            seeds = range(round_id * num_seeds + 1, (round_id + 1) * num_seeds + 1)
+            jobs = [(source_edgelist, target_edgelist, seed, timeout) for seed in seeds]
+            for seed, embedding in executor.map(_embed_seed, jobs):
+                if len(embedding) == 0:
+                    logger.debug("Seed %d failed", seed)
+                    continue
+                len_embedding = max(map(len, embedding.values()))
+                val_embedding = sum(map(len, embedding.values()))
+                logger.debug("Seed %d: max chain length %d, %d qubits", seed, len_embedding, val_embedding)
+                if (len_embedding < min_len) or (len_embedding == min_len and val_embedding < min_val):
+                    min_len = len_embedding
+                    min_val = val_embedding
+                    best_embedding = embedding
+            if best_embedding is not None:
+                break
+    logger.info("Best embedding: max chain length %s, %s qubits", min_len, min_val)
+    return best_embedding
 
-        # def is_disconnected(embedding):
-        #     for chain in embedding.values():
-        #         for i in range(0, len(chain)):
-        #             for j in range(i + 1, len(chain)):
-        #                 if (chain[i], chain[j]) not in target_edgelist and (chain[j], chain[i]) not in target_edgelist:
-        #                     return True
-        #     return False
-        #
-        # if is_disconnected(embedding):
-        #     print("Failed", trials)
-        #     continue
 
-        len_embedding = max(map(len, embedding.values()))
-        val_embedding = sum([a for a in map(len, embedding.values())])
-        print(len_embedding, val_embedding, trials)
-        if (len_embedding < min_len) or (len_embedding == min_len and val_embedding < min_val):
-            min_len = len_embedding
-            min_val = val_embedding
-            best_embedding = embedding
-    print(min_len, min_val)
+def get_embedding(bqm, output, target_edgelist=None, num_seeds=50, workers=None):
+    source_edgelist = list(chain(bqm.quadratic, ((int(v), int(v)) for v in bqm.linear)))
+    if target_edgelist is None:
+        target_edgelist = child_structure_dfs(DWaveSampler()).edgelist
+    best_embedding = find_best_embedding(source_edgelist, target_edgelist, num_seeds=num_seeds, workers=workers)
     embed_structure = EmbeddedStructure(target_edgelist, best_embedding)
     with open(output, 'w') as f:
         json.dump(embed_structure, f, indent=4)
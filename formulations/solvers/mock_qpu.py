@@ -0,0 +1,136 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import dimod
+import numpy as np
+from dwave.samplers import SimulatedAnnealingSampler
+
+from .embedding_cache import generate_target_graph
+
+# Per-sample and per-problem QPU times in microseconds, of the order reported by Advantage systems
+READOUT_TIME_PER_QUBIT = 0.1
+MIN_READOUT_TIME = 50.0
+DELAY_TIME_PER_SAMPLE = 20.58
+PROGRAMMING_TIME = 15500.0
+ACCESS_OVERHEAD_TIME = 1000.0
+
+
+class MockQPUSampler(dimod.Sampler, dimod.Structured):
+    """
+    An offline stand-in for DWaveSampler. It exposes the working graph of an ideal Pegasus or Zephyr QPU,
+    so it can be wrapped in EmbeddingComposite or FixedEmbeddingComposite like the real one.
+    Embedded problems are sampled with simulated annealing, one sweep per microsecond of annealing time,
+    and the SampleSet carries a timing dict with the keys of the QPU timing info.
+    With a latency, sample returns at once and the SampleSet resolves in a background thread after the delay,
+    like the futures of the cloud client.
+    """
+    parameters = {"num_reads": [], "annealing_time": [], "anneal_schedule": [], "label": [], "num_sweeps": [],
+                  "seed": []}
+
+    def __init__(self, edgelist=None, topology="pegasus", size=16, latency=0.0, max_in_flight=16) -> None:
+        """
+        :param edgelist: The edges of the working graph, see load_target_graph. Generated from the topology when
+        not given.
+        :param topology: pegasus or zephyr
+        :param size: The size parameter of the topology
+        :param latency: The artificial round-trip time of each problem in seconds
+        :param max_in_flight: The number of problems resolved at the same time when latency is set
+        """
+        self.latency = latency
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight) if latency > 0 else None
+        if edgelist is None:
+            edgelist = generate_target_graph(topology, size)
+        self._edgelist = sorted(tuple(sorted(edge)) for edge in edgelist)
+        self._nodelist = sorted(set(v for edge in self._edgelist for v in edge))
+        self._nodes = set(self._nodelist)
+        self._edges = set(self._edgelist)
+        self._properties = {
+            "chip_id": "MOCK_" + topology.upper(),
+            "topology": {"type": topology, "shape": [size]},
+            "qubits": self._nodelist,
+            "couplers": [list(edge) for edge in self._edgelist],
+            "h_range": [-4.0, 4.0],
+            "j_range": [-1.0, 1.0],
+            "extended_j_range": [-2.0, 1.0],
+            "annealing_time_range": [0.5, 2000.0],
+            "default_annealing_time": 20.0,
+            "num_reads_range": [1, 10000],
+        }
+
+    @property
+    def properties(self):
+        return self._properties
+
+    @property
+    def nodelist(self):
+        return self._nodelist
+
+    @property
+    def edgelist(self):
+        return self._edgelist
+
+    def sample(self, bqm, num_reads=1, annealing_time=None, anneal_schedule=None, label=None, num_sweeps=None,
+               seed=None, **kwargs):
+        """
+        :param bqm: A binary quadratic model on the working graph
+        :param num_reads: The number of samples
+        :param annealing_time: The annealing time in microseconds
+        :param anneal_schedule: A list of (time, s) points, overriding annealing_time
+        :param label: The label of the problem
+        :param num_sweeps: The number of sweeps of each read, derived from the annealing time by default
+        :param seed: The seed of the annealer
+        :return: A dimod.SampleSet
+        """
+        self._check_structure(bqm)
+        if anneal_schedule is not None:
+            anneal_time = float(anneal_schedule[-1][0])
+        elif annealing_time is not None:
+            anneal_time = float(annealing_time)
+        else:
+            anneal_time = self._properties["default_annealing_time"]
+        if num_sweeps is None:
+            num_sweeps = max(10, int(round(anneal_time)))
+        if self._executor is not None:
+            future = self._executor.submit(self._anneal, bqm, num_reads, num_sweeps, seed, anneal_time, label)
+            return dimod.SampleSet.from_future(future)
+        return self._anneal(bqm, num_reads, num_sweeps, seed, anneal_time, label)
+
+    def _anneal(self, bqm, num_reads, num_sweeps, seed, anneal_time, label):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        response = SimulatedAnnealingSampler().sample(bqm, num_reads=num_reads, num_sweeps=num_sweeps, seed=seed)
+        response.info.clear()
+        response.info["timing"] = self.timing(len(bqm.variables), num_reads, anneal_time)
+        response.info["problem_id"] = str(uuid.uuid4())
+        if label is not None:
+            response.info["problem_label"] = label
+        return response
+
+    @staticmethod
+    def timing(num_qubits, num_reads, anneal_time):
+        """
+        :param num_qubits: The number of active qubits
+        :param num_reads: The number of samples
+        :param anneal_time: The annealing time in microseconds
+        :return: A dict with the keys of the QPU timing info, in microseconds
+        """
+        readout_time = max(MIN_READOUT_TIME, READOUT_TIME_PER_QUBIT * num_qubits)
+        sampling_time = num_reads * (anneal_time + readout_time + DELAY_TIME_PER_SAMPLE)
+        post_processing_time = float(np.ceil(0.05 * num_reads))
+        return {
+            "qpu_sampling_time": sampling_time,
+            "qpu_anneal_time_per_sample": anneal_time,
+            "qpu_readout_time_per_sample": readout_time,
+            "qpu_access_time": PROGRAMMING_TIME + sampling_time,
+            "qpu_access_overhead_time": ACCESS_OVERHEAD_TIME,
+            "qpu_programming_time": PROGRAMMING_TIME,
+            "qpu_delay_time_per_sample": DELAY_TIME_PER_SAMPLE,
+            "total_post_processing_time": post_processing_time,
+            "post_processing_overhead_time": post_processing_time,
+        }
+
+    def _check_structure(self, bqm):
+        if any(v not in self._nodes for v in bqm.variables) or \
+                any(tuple(sorted((u, v))) not in self._edges for u, v in bqm.quadratic):
+            raise dimod.exceptions.BinaryQuadraticModelStructureError("The BQM does not match the working graph")
@@ -0,0 +1,217 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import dimod
+import numpy as np
+from dwave.samplers.sa.simulated_annealing import simulated_annealing
+
+from .csr import CSRModel
+
+
+class SweepModel(CSRModel):
+    """
+    The CSRModel of the parallel sampler. The variables are colored greedily so that each color class can be updated
+    at the same time.
+    """
+
+    def __init__(self, bqm) -> None:
+        super().__init__(bqm)
+        self._colors = None
+
+    @property
+    def colors(self):
+        """
+        The plan of each color class, built on first use so that only the workers that sweep build them
+        """
+        if self._colors is None:
+            self._colors = [self.plan(variables) for variables in self._color_classes()]
+        return self._colors
+
+    def ising(self):
+        """
+        The model over spins s = 2x - 1, as the compiled kernel of dwave.samplers takes it
+        :return: The linear biases, and the start, the end and the bias of each coupling
+        """
+        rows = self.rows()
+        upper = rows < self.indices
+        linear = 0.5 * self.linear + 0.25 * np.bincount(rows, weights=self.data, minlength=len(self))
+        return linear, (rows[upper], self.indices[upper], 0.25 * self.data[upper])
+
+    def default_beta_range(self):
+        """
+        The hot end accepts half of the worst single flips, the cold end 1% of the smallest ones
+        """
+        max_field = np.abs(self.linear) + np.bincount(self.rows(), weights=np.abs(self.data), minlength=len(self))
+        coefs = np.abs(np.concatenate([self.linear, self.data]))
+        coefs = coefs[coefs > 0]
+        if len(coefs) == 0:
+            return 0.1, 1.0
+        return np.log(2) / max_field.max(), np.log(100) / coefs.min()
+
+    def _color_classes(self):
+        colors = np.full(len(self), -1, dtype=np.int64)
+        for v in np.argsort(-np.diff(self.indptr), kind="stable"):
+            used = set(colors[self.indices[self.indptr[v]:self.indptr[v + 1]]].tolist())
+            color = 0
+            while color in used:
+                color += 1
+            colors[v] = color
+        return [np.flatnonzero(colors == color) for color in range(int(colors.max()) + 1)] if len(self) else []
+
+
+def metropolis_sweep(model, states, betas, rng):
+    """
+    Update every variable once, one color class at a time
+    :param model: A SweepModel
+    :param states: A matrix of states, one row per replica, updated in place
+    :param betas: The inverse temperature of each replica
+    :param rng: A numpy Generator
+    :return: The change of the energy of each replica
+    """
+    change = np.zeros(len(states))
+    for plan in model.colors:
+        variables = plan[0]
+        fields = model.fields(states, plan)
+        delta = (1 - 2 * states[:, variables]) * fields
+        accept = rng.random(delta.shape) < np.exp(-np.clip(betas[:, None] * delta, 0, 80))
+        states[:, variables] ^= accept.astype(states.dtype)
+        # The variables of a color class are not coupled, so their flips add up
+        change += np.where(accept, delta, 0).sum(axis=1, dtype=np.float64)
+    return change
+
+
+def anneal(model, num_reads, num_sweeps, beta_range, seed, **options):
+    """
+    Independent simulated annealing runs with a geometric beta schedule, on the compiled kernel of dwave.samplers
+    fed with the CSR arrays of the model: the reads of an anneal do not interact, so a vectorized sweep has nothing
+    to share between them
+    :return: A matrix of final states
+    """
+    rng = np.random.default_rng(seed)
+    linear, (starts, ends, couplings) = model.ising()
+    betas = np.geomspace(beta_range[0], beta_range[1], num_sweeps) if num_sweeps > 1 else np.array([beta_range[1]])
+    spins = 2 * rng.integers(0, 2, size=(num_reads, len(model)), dtype=np.int8) - 1
+    spins, _ = simulated_annealing(num_reads, linear, starts, ends, couplings, 1, betas,
+                                   int(rng.integers(pow(2, 31))), np.ascontiguousarray(spins, dtype=np.int8))
+    return ((spins + 1) // 2).astype(np.int8)
+
+
+def temper(model, num_reads, num_sweeps, beta_range, seed, num_replicas=8):
+    """
+    Parallel tempering: each read runs num_replicas chains on a fixed geometric beta ladder and neighbouring
+    chains exchange their states after every sweep with probability min(1, exp((b_k - b_k+1)(E_k - E_k+1)))
+    :return: A matrix of the best state met by the chains of each read
+    """
+    rng = np.random.default_rng(seed)
+    ladder = np.geomspace(beta_range[0], beta_range[1], num_replicas)
+    states = rng.integers(0, 2, size=(num_reads * num_replicas, len(model)), dtype=np.int8)
+    betas = np.tile(ladder, num_reads)
+    best_states = states[num_replicas - 1::num_replicas].copy()
+    best_energies = np.full(num_reads, np.inf)
+    # Track the energies by the changes of the sweeps instead of recomputing them
+    flat_energies = model.energies(states)
+    energies = flat_energies.reshape(num_reads, num_replicas)
+    for sweep in range(num_sweeps):
+        flat_energies += metropolis_sweep(model, states, betas, rng)
+        chains = states.reshape(num_reads, num_replicas, len(model))
+
+        # Keep the best state of each read
+        best_chain = energies.argmin(axis=1)
+        improved = energies[np.arange(num_reads), best_chain] < best_energies
+        best_energies[improved] = energies[improved, best_chain[improved]]
+        best_states[improved] = chains[improved, best_chain[improved]]
+
+        # Exchange the neighbouring chains of odd or even pairs, alternately
+        for k in range(sweep % 2, num_replicas - 1, 2):
+            log_accept = (ladder[k] - ladder[k + 1]) * (energies[:, k] - energies[:, k + 1])
+            swap = np.log(rng.random(num_reads)) < np.minimum(log_accept, 0)
+            chains[swap, k], chains[swap, k + 1] = chains[swap, k + 1].copy(), chains[swap, k].copy()
+            energies[swap, k], energies[swap, k + 1] = energies[swap, k + 1], energies[swap, k]
+    return best_states
+
+
+MODES = {
+    "anneal": anneal,
+    "tempering": temper,
+    "replica_exchange": temper,
+}
+
+
+def _run_chunk(args):
+    mode, model, num_reads, num_sweeps, beta_range, seed, options = args
+    return MODES[mode](model, num_reads, num_sweeps, beta_range, seed, **options)
+
+
+class ParallelAnnealingSampler(dimod.Sampler):
+    """
+    A simulated annealing sampler that splits the reads over worker processes, each of which receives the
+    CSR arrays of the model. Anneal runs the compiled sweeps of dwave.samplers in each worker, tempering runs
+    vectorized Metropolis sweeps over all the chains of the worker at once.
+    The worker processes are started on the first call and kept for the next ones, such as the batches of a stream,
+    until close.
+    """
+    parameters = {"num_reads": [], "num_sweeps": [], "beta_range": [], "mode": [], "num_replicas": [],
+                  "workers": [], "seed": []}
+    properties = {"modes": list(MODES)}
+
+    def __init__(self, executor=None) -> None:
+        """
+        :param executor: A process pool shared with the caller, who shuts it down. The sampler starts its own
+        when None.
+        """
+        self.executor = executor
+        self.owns_executor = executor is None
+        self.num_workers = 0
+
+    def pool(self, workers):
+        """
+        :param workers: The number of worker processes needed
+        :return: The executor, restarted when the sampler owns it and it has fewer workers
+        """
+        if self.owns_executor and self.num_workers < workers:
+            self.close()
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+            self.num_workers = workers
+        return self.executor
+
+    def close(self):
+        """
+        Shut the worker processes of the sampler down, the next call starts new ones
+        """
+        if self.owns_executor and self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+            self.num_workers = 0
+
+    def sample(self, bqm, num_reads=1000, num_sweeps=100, beta_range=None, mode="anneal", num_replicas=8,
+               workers=None, seed=None, **kwargs):
+        """
+        :param bqm: A binary quadratic model
+        :param num_reads: The number of samples
+        :param num_sweeps: The number of sweeps of each read
+        :param beta_range: The (hot, cold) inverse temperatures, derived from the biases by default
+        :param mode: anneal for independent annealing runs, tempering (or replica_exchange) for parallel tempering
+        :param num_replicas: The number of temperatures of each read in tempering mode
+        :param workers: The number of worker processes, defaults to the number of CPUs
+        :param seed: The seed of the random generators
+        :return: A dimod.SampleSet
+        """
+        if mode not in MODES:
+            raise ValueError("Unknown mode {}, expected one of {}".format(mode, list(MODES)))
+        model = SweepModel(bqm)
+        if beta_range is None:
+            beta_range = model.default_beta_range()
+        workers = min(workers or os.cpu_count() or 1, num_reads)
+        seeds = np.random.SeedSequence(seed).spawn(workers)
+        chunks = [len(chunk) for chunk in np.array_split(np.arange(num_reads), workers)]
+        options = {"num_replicas": num_replicas} if MODES[mode] is temper else {}
+        jobs = [(mode, model, chunk, num_sweeps, beta_range, seeds[i], options) for i, chunk in enumerate(chunks)]
+        if workers == 1:
+            states = [_run_chunk(jobs[0])]
+        else:
+            states = list(self.pool(workers).map(_run_chunk, jobs))
+        states = np.vstack(states)
+        if bqm.vartype is dimod.SPIN:
+            states = 2 * states - 1
+        return dimod.SampleSet.from_samples_bqm((states, model.variables), bqm,
+                                                info={"beta_range": [float(beta) for beta in beta_range], "mode": mode})
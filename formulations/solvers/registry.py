@@ -0,0 +1,39 @@
+import importlib
+from collections.abc import Mapping
+
+
+class SolverRegistry(Mapping):
+    """
+    A mapping from the name of a solver backend to its solve function, which imports the module of a backend
+    the first time it is looked up, so listing the backends or selecting one leaves the others unimported
+    """
+
+    def __init__(self, package, backends=None):
+        """
+        :param package: The package the module names are relative to
+        :param backends: A dict mapping the name of each backend to its module and the name of its solve function
+        """
+        self.package = package
+        self.backends = dict(backends) if backends is not None else {}
+        self.loaded = {}
+
+    def register(self, name, module, function):
+        """
+        :param name: The name of the backend, the value of RunConfig.solver
+        :param module: The module of the solve function, relative to the package when it starts with a dot
+        :param function: The name of the solve function in the module
+        """
+        self.backends[name] = (module, function)
+        self.loaded.pop(name, None)
+
+    def __getitem__(self, name):
+        if name not in self.loaded:
+            module, function = self.backends[name]
+            self.loaded[name] = getattr(importlib.import_module(module, self.package), function)
+        return self.loaded[name]
+
+    def __iter__(self):
+        return iter(self.backends)
+
+    def __len__(self):
+        return len(self.backends)
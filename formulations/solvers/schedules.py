@@ -0,0 +1,6 @@
+# The anneal schedules of the QPU by id, as (time in microseconds, anneal fraction) points. Kept apart from
+# solve_bqm so that the tuning portfolio lists them without importing the solvers.
+SCHEDULES = {12: [(0.0, 0.0), (40.0, 0.4), (180.0, 0.4), (200.0, 1.0)],
+             11: [(0.0, 0.0), (40.0, 0.5), (120.0, 0.5), (200.0, 1.0)],
+             13: [(0.0, 0.0), (40.0, 0.5), (130.0, 0.5), (200.0, 1.0)],
+             14: [(0.0, 0.0), (30.0, 0.5), (160.0, 0.5), (200.0, 1.0)]}
@@ -1,120 +1,149 @@
-import json
-import os
 import time
 
-from dwave.system import EmbeddingComposite, FixedEmbeddingComposite
-from dwave.system.samplers import DWaveSampler
-from dwave.embedding.chain_strength import uniform_torque_compensation
-from minorminer.utils import DisconnectedChainError
 from dwave.samplers import SimulatedAnnealingSampler
-import dwave.inspector
 
-from .export_embedding import get_embedding
+from ..config import RunConfig
+from .embedding_cache import EmbeddingCache, load_target_graph
+from .schedules import SCHEDULES
+
+# dwave.system and dwave.inspector take seconds to import, so the QPU functions import them when called, and the
+# mock QPU and the parallel sampler are imported by the backends that use them only
+
+
+def qpu_child(config):
+    """
+    :param config: The RunConfig of the run
+    :return: The structured sampler selected by config.qpu, and the edges of the graph to embed into
+    """
+    if config.qpu == "mock":
+        from .mock_qpu import MockQPUSampler
+
+        qpu = MockQPUSampler(edgelist=load_target_graph(config.target_graph) if config.target_graph else None)
+        return qpu, qpu.edgelist
+    from dwave.system import DWaveSampler
+
+    qpu = DWaveSampler()
+    return qpu, load_target_graph(config.target_graph) if config.target_graph else qpu.edgelist
+
+
+def qpu_sampler(bqm, config, qpu=None):
+    """
+    Build the QPU sampler, on the cached embedding of the BQM when there is one
+    :param bqm: The binary quadratic model
+    :param config: The RunConfig of the run
+    :param qpu: A structured sampler and its target edge list from qpu_child, created when not given
+    :return: The sampler, the embedding cache, the target graph and the cached embedding or None
+    """
+    from dwave.system import EmbeddingComposite, FixedEmbeddingComposite
+    from minorminer.utils import DisconnectedChainError
+
+    qpu, target_edgelist = qpu if qpu is not None else qpu_child(config)
+    cache = EmbeddingCache(config.embedding_cache_dir) if config.embedding_cache_dir else None
+    embedding = cache.get(bqm, target_edgelist) if cache is not None else None
+    if embedding is not None:
+        try:
+            return FixedEmbeddingComposite(qpu, embedding=embedding), cache, target_edgelist, embedding
+        except DisconnectedChainError:
+            pass
+    return EmbeddingComposite(qpu), cache, target_edgelist, None
+
+
+def qpu_parameters(bqm, chain_strength_prefactor=0.25, annealing_time=200, anneal_schedule_id=-1):
+    """
+    :return: The keyword arguments of the QPU sampler, and the chain strength
+    """
+    from dwave.embedding.chain_strength import uniform_torque_compensation
 
-def solve_quantum_annealing(bqm,
-                            method="?_",
-                            num_reads=1000):
-    chain_strength_prefactor = 0.25
-    annealing_time = 200
-    anneal_schedule_id = -1
     chain_strength = uniform_torque_compensation(
         bqm=bqm, prefactor=chain_strength_prefactor)
-    schedules = {12: [(0.0, 0.0), (40.0, 0.4), (180.0, 0.4), (200.0, 1.0)],
-                 11: [(0.0, 0.0), (40.0, 0.5), (120.0, 0.5), (200.0, 1.0)],
-                 13: [(0.0, 0.0), (40.0, 0.5), (130.0, 0.5), (200.0, 1.0)],
-                 14: [(0.0, 0.0), (30.0, 0.5), (160.0, 0.5), (200.0, 1.0)]}
-    embed_config = method + str(num_reads) + "-" + str(chain_strength)
-    solver_config = method + str(num_reads) + "-" + str(chain_strength) + "s" + str(anneal_schedule_id) + "_A" + str(
-        annealing_time)
-    os.environ["SOLVER_CONFIG"] = solver_config
-    data_name = os.getenv("INPUT_FILE")
-    # data_name = ""
-    output_dir = "output/" + data_name + "/"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    # get_embedding(bqm, output_dir + embed_config + ".json")
-    # with open(output_dir + embed_config + ".json", "r") as f:
-    #     embedding = json.load(f)
-    # embedding = {int(k): v for k, v in embedding.items()}
-    # try:
-    #     sampler = FixedEmbeddingComposite(DWaveSampler(), embedding=embedding)
-    # except DisconnectedChainError as e:
-    #     raise RuntimeError(e)
-    sampler = EmbeddingComposite(DWaveSampler())
-
-    start = time.time()
+    # The embedding cache and the reports read the embedding from the response, which importing dwave.inspector
+    # used to turn on for every sampler
+    parameters = {"chain_strength": chain_strength, "return_embedding": True}
     if anneal_schedule_id == -1:
-        response = sampler.sample(bqm=bqm,
-                                  chain_strength=chain_strength,
-                                  num_reads=num_reads,
-                                  label=solver_config,
-                                  annealing_time=annealing_time)
+        parameters["annealing_time"] = annealing_time
     else:
-        schedule = schedules[anneal_schedule_id]
-        response = sampler.sample(bqm=bqm,
-                                  chain_strength=chain_strength,
-                                  num_reads=num_reads,
-                                  label=solver_config,
-                                  # annealing_time=annealing_time,
-                                  anneal_schedule=schedule)
-    end = time.time()
-    dwave.inspector.show(response)
-    chains = response.info["embedding_context"]["embedding"].values()
-    # for chain in chains:
-    #     if len(chain) > 10:
-    #         print(chain)
+        parameters["anneal_schedule"] = SCHEDULES[anneal_schedule_id]
+    return parameters, chain_strength
+
+
+def qpu_config_name(method, num_reads, chain_strength, anneal_schedule_id=-1, annealing_time=200):
+    return method + str(num_reads) + "-" + str(chain_strength) + "s" + str(anneal_schedule_id) + "_A" + str(
+        annealing_time)
+
 
+def write_qpu_report(bqm, response, config, time_elapsed, embedding_cache_hit, chain_strength_prefactor,
+                     chain_strength):
+    """
+    Report the embedding, the best state and the timing of a QPU run as <solver_config>_1. The embedding is empty
+    when the preprocessing fixed every variable, and the chain length is then reported as 0.
+    """
+    chains = response.info["embedding_context"]["embedding"].values()
     config_dict = {
-        "config": solver_config,
+        "config": config.solver_config,
         "num_vars": len(bqm.variables),
         "num_qubit": sum([len(chain) for chain in chains]),
-        "time_elapsed": end - start,
+        "time_elapsed": time_elapsed,
         "best_state": {
             "sample": response.record.sample[0].tolist(),
-            "energy": response.record.energy[0],
-            "chain_break_fraction": response.record.chain_break_fraction[0],
+            "energy": float(response.record.energy[0]),
+            "chain_break_fraction": float(response.record.chain_break_fraction[0]),
         },
+        "embedding_cache_hit": embedding_cache_hit,
         "chain_strength_prefactor": chain_strength_prefactor,
         "chain_strength": chain_strength,
-        "max_chain_length": max([len(chain) for chain in chains]),
+        "max_chain_length": max([len(chain) for chain in chains], default=0),
         "timing_info": response.info["timing"],
         "embedding_info": response.info["embedding_context"]
     }
-    with open(output_dir + solver_config + "_1.json", "w") as f:
-        json.dump(config_dict, f, indent=4)
-    # file_response_output = open(output_dir + solver_config + ".txt", "w")
-    # file_response_output.write("Config: " + solver_config + "\n")
-    # file_response_output.write("Number of source variables: " + str(len(bqm.variables)) + "\n")
-    # file_response_output.write("Number of target variables: " + str(sum([len(chain) for chain in chains])) + "\n")
-    # file_response_output.write("Time Elapsed: " + str(end - start) + "\n")
-    # file_response_output.write(
-    #     "Best State: " + str(response.record.sample[0]) + "\n" + str(response.record.energy[0]) + "\t" + str(
-    #         response.record.chain_break_fraction[0]) + "\n")
-    # file_response_output.write("ChainStr/ChainLen: " + str(chain_strength) + "/" + str(
-    #     max([len(chain) for chain in chains])) + "\n")
-    # file_response_output.write("Info: " + str(response.info["timing"]) + "\n")
-    # file_response_output.write("Embedding Info: " + str(response.info["embedding_context"]) + "\n")
+    config.write_report("_1", config_dict)
+
+
+def solve_quantum_annealing(bqm,
+                            method="?_",
+                            num_reads=1000,
+                            config=None):
+    config = config if config is not None else RunConfig()
+    chain_strength_prefactor = config.chain_strength_prefactor
+    annealing_time = config.annealing_time
+    anneal_schedule_id = config.anneal_schedule_id
+    parameters, chain_strength = qpu_parameters(bqm, chain_strength_prefactor=chain_strength_prefactor,
+                                                annealing_time=annealing_time,
+                                                anneal_schedule_id=anneal_schedule_id)
+    solver_config = qpu_config_name(method, num_reads, chain_strength, anneal_schedule_id, annealing_time)
+    config.solver_config = solver_config
+    sampler, cache, target_edgelist, embedding = qpu_sampler(bqm, config)
 
+    start = time.time()
+    response = sampler.sample(bqm=bqm,
+                              num_reads=num_reads,
+                              label=solver_config,
+                              **parameters)
+    end = time.time()
+    if cache is not None and embedding is None:
+        cache.put(bqm, target_edgelist, response.info["embedding_context"]["embedding"])
+    if config.qpu != "mock":
+        import dwave.inspector
+        dwave.inspector.show(response)
+    write_qpu_report(bqm, response, config, end - start, embedding is not None, chain_strength_prefactor,
+                     chain_strength)
     return response
 
 
-def solve_simulated_annealing(bqm, method="?_", num_reads=1000):
+def solve_simulated_annealing(bqm, method="?_", num_reads=1000, config=None):
     sampler = SimulatedAnnealingSampler()
-    # beta_range = [0.1, 4]
-    num_sweeps = 100
-    # config = method + str(num_reads) + "-SA" + "".join(str(beta_range).split(" ")) + "s" + str(num_sweeps)
+    config = config if config is not None else RunConfig()
+    num_sweeps = config.num_sweeps
+    beta_range = config.beta_range
     solver_config = method + str(num_reads) + "-SA" + "s" + str(num_sweeps)
-    os.environ["SOLVER_CONFIG"] = solver_config
-    data_name = os.getenv("INPUT_FILE")
-    output_dir = "output/" + data_name + "/"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    if beta_range is not None:
+        solver_config += "b" + "".join(str(list(beta_range)).split(" "))
+    config.solver_config = solver_config
     # print(config)
     start = time.time()
     response = sampler.sample(bqm,
                               num_reads=num_reads,
                               label=solver_config,
-                              # beta_range=beta_range,
+                              beta_range=beta_range,
                               num_sweeps=num_sweeps)
     end = time.time()
     config_dict = {
@@ -122,6 +151,34 @@ def solve_simulated_annealing(bqm, method="?_", num_reads=1000):
         "num_vars": len(bqm.variables),
         "time_elapsed": end - start,
     }
-    with open(output_dir + solver_config + "_1.json", "w") as f:
-        json.dump(config_dict, f, indent=4)
+    config.write_report("_1", config_dict)
+    return response
+
+
+def solve_parallel_annealing(bqm, method="?_", num_reads=1000, config=None):
+    from .parallel_sa import ParallelAnnealingSampler
+
+    config = config if config is not None else RunConfig()
+    sampler = ParallelAnnealingSampler()
+    solver_config = method + str(num_reads) + "-PSA" + config.sa_mode + "s" + str(config.num_sweeps)
+    config.solver_config = solver_config
+    start = time.time()
+    try:
+        response = sampler.sample(bqm,
+                                  num_reads=num_reads,
+                                  num_sweeps=config.num_sweeps,
+                                  beta_range=config.beta_range,
+                                  mode=config.sa_mode,
+                                  workers=config.workers)
+    finally:
+        sampler.close()
+    end = time.time()
+    config_dict = {
+        "config": solver_config,
+        "num_vars": len(bqm.variables),
+        "time_elapsed": end - start,
+        "beta_range": response.info["beta_range"],
+        "workers": config.workers,
+    }
+    config.write_report("_1", config_dict)
     return response
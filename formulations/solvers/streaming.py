@@ -0,0 +1,109 @@
+import time
+
+import dimod
+import numpy as np
+from dwave.samplers import SimulatedAnnealingSampler
+
+from ..config import RunConfig
+from .solve_bqm import qpu_parameters, qpu_sampler
+
+
+def sample_batches(bqm, num_reads=1000, batch_size=50, config=None, label=None):
+    """
+    Draw the samples of a run in batches, from the backend selected by config.solver
+    :param bqm: The binary quadratic model
+    :param num_reads: The total number of samples
+    :param batch_size: The number of samples of each batch
+    :param config: The RunConfig of the run
+    :param label: The label of the QPU problems
+    :return: A generator of dimod.SampleSet
+    """
+    config = config if config is not None else RunConfig()
+    # Import the backend selected only, see SOLVERS
+    if config.solver == "qa":
+        from dwave.system import FixedEmbeddingComposite
+
+        sampler, cache, target_edgelist, embedding = qpu_sampler(bqm, config)
+        parameters, _ = qpu_parameters(bqm, chain_strength_prefactor=config.chain_strength_prefactor,
+                                       annealing_time=config.annealing_time,
+                                       anneal_schedule_id=config.anneal_schedule_id)
+    elif config.solver == "psa":
+        from .parallel_sa import ParallelAnnealingSampler
+
+        sampler = ParallelAnnealingSampler()
+        parameters = {"num_sweeps": config.num_sweeps, "beta_range": config.beta_range, "mode": config.sa_mode,
+                      "workers": config.workers}
+    elif config.solver == "decomp":
+        from .decomposition import DecompositionSampler, decomposition_parameters
+
+        sampler = DecompositionSampler()
+        parameters = decomposition_parameters(config)
+    else:
+        sampler = SimulatedAnnealingSampler()
+        parameters = {"num_sweeps": config.num_sweeps, "beta_range": config.beta_range}
+    drawn = 0
+    try:
+        while drawn < num_reads:
+            size = min(batch_size, num_reads - drawn)
+            if config.solver == "qa":
+                batch = sampler.sample(bqm, num_reads=size, label=label, **parameters)
+                if embedding is None:
+                    # Submit the next batches on the embedding found for the first one
+                    embedding = batch.info["embedding_context"]["embedding"]
+                    if cache is not None:
+                        cache.put(bqm, target_edgelist, embedding)
+                    sampler = FixedEmbeddingComposite(sampler.child, embedding=embedding)
+            else:
+                batch = sampler.sample(bqm, num_reads=size, **parameters)
+            drawn += size
+            yield batch
+    finally:
+        if config.solver == "psa":
+            # Shut down the worker processes kept across the batches
+            sampler.close()
+
+
+def solve_streaming(bqm, method="?_", num_reads=1000, config=None, stop_when=None):
+    """
+    Sample in batches of config.stream_batch reads and stop as soon as a sample satisfies stop_when
+    :param bqm: The binary quadratic model
+    :param method: The prefix of the solver config
+    :param num_reads: The maximum number of samples
+    :param config: The RunConfig of the run
+    :param stop_when: A function of a dimod.SampleSet, returning a mask of its records, True for the valid
+    factorizations
+    :return: The samples of every batch drawn
+    """
+    config = config if config is not None else RunConfig()
+    solver_config = method + str(num_reads) + "-ST" + config.solver + "b" + str(config.stream_batch)
+    config.solver_config = solver_config
+    batches = []
+    reads = 0
+    time_to_solution = None
+    reads_to_solution = None
+    start = time.time()
+    for batch in sample_batches(bqm, num_reads=num_reads, batch_size=config.stream_batch, config=config,
+                                label=solver_config):
+        batches.append(batch)
+        if stop_when is not None:
+            answers = np.flatnonzero(stop_when(batch))
+            if len(answers) > 0:
+                # The reads of the previous batches and of the records up to the first answer, included
+                time_to_solution = time.time() - start
+                reads_to_solution = reads + int(batch.record.num_occurrences[:answers[0] + 1].sum())
+        reads += int(batch.record.num_occurrences.sum())
+        if reads_to_solution is not None:
+            break
+    end = time.time()
+    response = dimod.concatenate(batches)
+    config_dict = {
+        "config": solver_config,
+        "num_vars": len(bqm.variables),
+        "time_elapsed": end - start,
+        "num_batches": len(batches),
+        "reads_drawn": reads,
+        "time_to_solution": time_to_solution,
+        "reads_to_solution": reads_to_solution,
+    }
+    config.write_report("_1", config_dict)
+    return response
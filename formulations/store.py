@@ -0,0 +1,142 @@
+import json
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+INDEX_NAME = "index.jsonl"
+
+
+class ResultStore:
+    """
+    An append-only store of runs. The samples of each run are kept in a compressed .npz file, with the binary
+    samples packed 8 per byte, and every run adds one JSON line to a shared index with its key
+    (n, method, solver_config) and its counts, so runs can be filtered and aggregated from the index alone.
+    The .npz file is renamed into place before its index line is appended under an exclusive lock, so
+    concurrent writers never expose a partial run.
+    """
+
+    def __init__(self, directory="output/store") -> None:
+        self.directory = directory
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        os.makedirs(os.path.join(directory, "runs"), exist_ok=True)
+
+    def append(self, response, evaluation=None, solver_info=None, **fields) -> str:
+        """
+        Store the samples of a run and index it
+        :param response: The samples from the solver
+        :param evaluation: The result of evaluate_response, to store the is_answer and is_optimal masks
+        :param solver_info: The report of the solver. Its embedding and best sample go to the .npz file.
+        :param fields: The key and the statistics of the run, such as n, method, solver_config and sol_pct
+        :return: The id of the run
+        """
+        run_id = uuid.uuid4().hex
+        record = response.record
+        samples = np.asarray(record.sample)
+        packed = bool(samples.size == 0 or ((samples == 0) | (samples == 1)).all())
+        arrays = {
+            "sample": np.packbits(samples.astype(bool), axis=1) if packed else samples,
+            "num_variables": np.array(samples.shape[1] if samples.ndim == 2 else 0),
+            "packed": np.array(packed),
+            "energy": np.asarray(record.energy),
+            "num_occurrences": np.asarray(record.num_occurrences),
+            "variables": np.asarray(list(response.variables)),
+        }
+        if "chain_break_fraction" in record.dtype.names:
+            arrays["chain_break_fraction"] = np.asarray(record.chain_break_fraction)
+        if evaluation is not None:
+            arrays["is_answer"] = np.asarray(evaluation["is_answer"], dtype=bool)
+            arrays["is_optimal"] = np.asarray(evaluation["is_optimal"], dtype=bool)
+
+        solver_info = dict(solver_info) if solver_info is not None else {}
+        embedding_info = solver_info.pop("embedding_info", None)
+        if embedding_info is not None:
+            arrays["embedding_info"] = np.array(json.dumps(embedding_info, default=str))
+        if isinstance(solver_info.get("best_state"), dict):
+            solver_info["best_state"] = {key: value for key, value in solver_info["best_state"].items()
+                                         if key != "sample"}
+
+        path = os.path.join("runs", run_id + ".npz")
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.join(self.directory, "runs"), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, os.path.join(self.directory, path))
+
+        entry = {key: str(value) if key == "n" else value for key, value in fields.items()}
+        entry.update(run_id=run_id, file=path, time=time.time(), solver=solver_info)
+        self._append_line(json.dumps(entry, default=str))
+        return run_id
+
+    def runs(self, **filters):
+        """
+        :param filters: Fields of the index and their required values, n may be given as an int
+        :return: The index entries of the matching runs, in the order they were stored
+        """
+        filters = {key: str(value) if key == "n" else value for key, value in filters.items()}
+        return [entry for entry in self._read_index() if all(entry.get(key) == value
+                                                              for key, value in filters.items())]
+
+    def load(self, run_id):
+        """
+        :param run_id: The id of a run
+        :return: A dict of the arrays of the run, with the samples unpacked
+        """
+        with np.load(os.path.join(self.directory, "runs", run_id + ".npz")) as data:
+            arrays = {key: data[key] for key in data.files}
+        if arrays.pop("packed"):
+            num_variables = int(arrays["num_variables"])
+            arrays["sample"] = np.unpackbits(arrays["sample"], axis=1, count=num_variables).astype(np.int8)
+        if "embedding_info" in arrays:
+            arrays["embedding_info"] = json.loads(str(arrays["embedding_info"]))
+        return arrays
+
+    def aggregate(self, by=("n", "method", "solver_config"), **filters):
+        """
+        Pool the counts of the matching runs by key, weighting every run by its number of reads
+        :param by: The fields of the key
+        :param filters: See runs
+        :return: A dict mapping each key to its number of runs, its total counts, sol_pct and opt_pct
+        """
+        groups = {}
+        for entry in self.runs(**filters):
+            key = tuple(entry.get(field) for field in by)
+            group = groups.setdefault(key, {"runs": 0, "total_count": 0, "sol_count": 0, "opt_count": 0})
+            group["runs"] += 1
+            group["total_count"] += entry.get("total_count", 0)
+            group["sol_count"] += entry.get("sol_count", 0)
+            group["opt_count"] += entry.get("opt_count", 0)
+        for group in groups.values():
+            group["sol_pct"] = group["sol_count"] / group["total_count"] if group["total_count"] else 0.0
+            group["opt_pct"] = group["opt_count"] / group["total_count"] if group["total_count"] else 0.0
+        return groups
+
+    def _append_line(self, line) -> None:
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            os.write(fd, (line + "\n").encode())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _read_index(self):
+        entries = []
+        try:
+            with open(self.index_path, "r") as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return entries
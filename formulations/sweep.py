@@ -0,0 +1,154 @@
+import asyncio
+import copy
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import product
+
+from dwave.system import FixedEmbeddingComposite
+from minorminer import minorminer
+
+from .batch import FORMULATIONS
+from .config import RunConfig
+from .solvers.embedding_cache import EmbeddingCache, source_edgelist
+from .solvers.solve_bqm import qpu_child, qpu_config_name, qpu_parameters, qpu_sampler, write_qpu_report
+from .tracing import Tracer
+
+
+class SweepJob:
+    """
+    One QPU problem of a sweep: a semiprime with a chain strength prefactor and an anneal schedule
+    """
+
+    def __init__(self, n, chain_strength_prefactor=0.25, annealing_time=200, anneal_schedule_id=-1) -> None:
+        """
+        :param n: A safe semiprime
+        :param chain_strength_prefactor: The prefactor of uniform_torque_compensation
+        :param annealing_time: The annealing time in microseconds, used when anneal_schedule_id is -1
+        :param anneal_schedule_id: A key of SCHEDULES, or -1 for a plain anneal of annealing_time
+        """
+        self.n = n
+        self.chain_strength_prefactor = chain_strength_prefactor
+        self.annealing_time = annealing_time
+        self.anneal_schedule_id = anneal_schedule_id
+
+
+def sweep_jobs(ns, chain_strength_prefactors=(0.25,), annealing_times=(200,), anneal_schedule_ids=(-1,)):
+    """
+    :return: A SweepJob for every combination of the semiprimes and the parameters
+    """
+    return [SweepJob(n, prefactor, annealing_time, schedule_id) for n, prefactor, annealing_time, schedule_id
+            in product(ns, chain_strength_prefactors, annealing_times, anneal_schedule_ids)]
+
+
+async def sample_async(sampler, bqm, executor=None, **parameters):
+    """
+    Submit a problem from a worker thread and wait for its samples without blocking the event loop
+    :param sampler: A dimod sampler
+    :param bqm: The binary quadratic model
+    :param executor: The executor of the submission and of the wait, the default executor when None
+    :param parameters: The keyword arguments of sampler.sample
+    :return: The resolved dimod.SampleSet
+    """
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(executor, partial(sampler.sample, bqm, **parameters))
+    await loop.run_in_executor(executor, response.resolve)
+    return response
+
+
+async def run_sweep(jobs, formulation="direct", config=None, qpu=None, max_in_flight=8, on_result=None):
+    """
+    Keep up to max_in_flight QPU problems submitted at once and post-process each one as soon as it returns,
+    while the others are still sampling. The model and the embedding of each semiprime are built once,
+    in worker threads, and shared by its jobs.
+    :param jobs: A list of SweepJob
+    :param formulation: The name of the formulation, see FORMULATIONS
+    :param config: The RunConfig of the sweep. The results of n are written to <input_name>/<n>/.
+    :param qpu: A structured sampler and its target edge list, from qpu_child(config) when not given
+    :param max_in_flight: The number of problems submitted at the same time
+    :param on_result: A function called with the result of each job as it completes
+    :return: The results of the jobs, in completion order
+    """
+    config = config if config is not None else RunConfig()
+    qpu = qpu if qpu is not None else qpu_child(config)
+    # Smallest models first, so their embeddings are searched first
+    jobs = sorted(jobs, key=lambda job: job.n.bit_length())
+    cache = EmbeddingCache(config.embedding_cache_dir) if config.embedding_cache_dir else None
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    models = {}
+
+    def prepare(n):
+        model_config = copy.copy(config)
+        model_config.input_name = os.path.join(config.input_name, str(n))
+        model = FORMULATIONS[formulation]()
+        model.tracer = Tracer(enabled=config.trace is not None)
+        q, bqm, offset = model.prepare_model(n, model_config)
+        sampler, _, target_edgelist, embedding = qpu_sampler(bqm, model_config, qpu=qpu)
+        cache_hit = embedding is not None
+        if not cache_hit and len(bqm.variables) > 0:
+            # The cache searches the embeddings of the semiprimes one after the other in the background,
+            # while the jobs of the semiprimes already embedded keep the QPU busy
+            if cache is not None:
+                embedding = cache.warm(bqm, target_edgelist).result()
+            else:
+                embedding = minorminer.find_embedding(source_edgelist(bqm), target_edgelist)
+            if not embedding:
+                raise ValueError("No embedding found for {}".format(n))
+            sampler = FixedEmbeddingComposite(qpu[0], embedding=embedding)
+        return model, model_config, q, bqm, offset, sampler, cache_hit
+
+    async def run_job(job):
+        if job.n not in models:
+            models[job.n] = loop.run_in_executor(None, prepare, job.n)
+        model, model_config, q, bqm, offset, sampler, cache_hit = await models[job.n]
+        parameters, chain_strength = qpu_parameters(bqm, chain_strength_prefactor=job.chain_strength_prefactor,
+                                                    annealing_time=job.annealing_time,
+                                                    anneal_schedule_id=job.anneal_schedule_id)
+        job_config = copy.copy(model_config)
+        job_config.reports = {}
+        job_config.solver_config = qpu_config_name(model.method, config.num_reads, chain_strength,
+                                                   job.anneal_schedule_id, job.annealing_time)
+        async with semaphore:
+            start = time.time()
+            response = await sample_async(sampler, bqm, executor=executor, num_reads=config.num_reads,
+                                          label=job_config.solver_config, **parameters)
+            end = time.time()
+
+        # Post-process on the event loop while the other jobs keep sampling
+        write_qpu_report(bqm, response, job_config, end - start, cache_hit, job.chain_strength_prefactor,
+                         chain_strength)
+        p, q_ans = model.report_response(job.n, response, q, offset, job_config)
+        result = {
+            "n": str(job.n),
+            "chain_strength_prefactor": job.chain_strength_prefactor,
+            "chain_strength": chain_strength,
+            "annealing_time": job.annealing_time,
+            "anneal_schedule_id": job.anneal_schedule_id,
+            "solver_config": job_config.solver_config,
+            "p": str(p),
+            "q": str(q_ans),
+            "success": p * q_ans == job.n,
+            "time_elapsed": end - start,
+            "embedding_cache_hit": cache_hit,
+        }
+        result.update(model.stats)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    try:
+        return [await task for task in asyncio.as_completed([run_job(job) for job in jobs])]
+    finally:
+        executor.shutdown(wait=False)
+
+
+def sweep(jobs, formulation="direct", config=None, qpu=None, max_in_flight=8, on_result=None):
+    """
+    Run run_sweep to completion from synchronous code
+    :return: The results of the jobs, in completion order
+    """
+    return asyncio.run(run_sweep(jobs, formulation=formulation, config=config, qpu=qpu,
+                                 max_in_flight=max_in_flight, on_result=on_result))
@@ -0,0 +1,58 @@
+from .qubo import SparseQubo
+
+_templates = {}
+
+
+class ModelTemplate:
+    """
+    The part of the model of a formulation shared by every n with the same template key, compiled once.
+    The HUBO of n is split into a base that does not depend on n, of any degree, and a sum of features
+    f_k(n) * H_k where every H_k is at most quadratic. Only the base is quadratized, so the QUBO of a new n
+    is a merge of the compiled sparse QUBO with the scaled H_k.
+    """
+
+    def __init__(self, formulation, n) -> None:
+        """
+        Compile the template on the formulation, whose state is reset
+        :param formulation: A DirectFormulation or a subclass
+        :param n: Any semiprime with the template key of the template
+        """
+        formulation.reset()
+        base, features = formulation.build_template_hubo(n)
+        terms, self.offset = formulation.reduce_hubo(base.to_dict(), base.offset)
+        self.q = formulation.to_qubo(terms)
+        self.features = []
+        for feature in features:
+            if feature.degree > 2:
+                raise ValueError("The terms depending on n must be at most quadratic, got degree {}".format(
+                    feature.degree))
+            self.features.append((SparseQubo.from_poly(feature, formulation.var_cnt), feature.offset))
+        self.var_map = dict(formulation.var_map)
+        self.var_cnt = formulation.var_cnt
+        self.report = formulation.quadratization.report()
+
+    def instantiate(self, features):
+        """
+        :param features: The values f_k(n), see template_features
+        :return: The SparseQubo and the offset of n
+        """
+        qubos = [self.q]
+        offset = self.offset
+        for factor, (terms, constant) in zip(features, self.features):
+            if factor == 0:
+                continue
+            qubos.append(terms.scale(factor))
+            offset += factor * constant
+        return SparseQubo.concatenate(qubos, self.q.num_variables), offset
+
+
+def get_template(formulation, n) -> ModelTemplate:
+    """
+    :param formulation: A DirectFormulation or a subclass
+    :param n: A safe semiprime
+    :return: The template of n, compiled on the formulation unless it is cached in this process
+    """
+    key = (type(formulation), formulation.quadratization.name, formulation.template_key(n))
+    if key not in _templates:
+        _templates[key] = ModelTemplate(formulation, n)
+    return _templates[key]
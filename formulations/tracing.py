@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+import time
+
+
+class Span:
+    """
+    A timed stage of the pipeline with its counters, recorded by a Tracer when it exits
+    """
+
+    def __init__(self, tracer, name, counters) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.counters = counters
+        self.start = None
+        self.duration = None
+
+    def count(self, **counters) -> None:
+        """
+        Set counters of the span, such as the number of terms or of auxiliary variables
+        """
+        self.counters.update(counters)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.duration = time.perf_counter() - self.start
+        self.tracer.record(self)
+        return False
+
+
+class _NullSpan:
+    def count(self, **counters) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Collect the spans of a run and write them as a JSON list or in the Chrome trace event format,
+    which chrome://tracing and Perfetto open directly.
+    A disabled tracer hands out a shared no-op span, so instrumented code costs one call per stage.
+    """
+
+    def __init__(self, enabled=True) -> None:
+        self.enabled = enabled
+        self.spans = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def span(self, name, **counters):
+        """
+        :param name: The name of the stage
+        :param counters: The initial counters of the span
+        :return: A context manager timing the stage
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, counters)
+
+    def record(self, span) -> None:
+        with self._lock:
+            self.spans.append({
+                "name": span.name,
+                "start": span.start - self.origin,
+                "duration": span.duration,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "counters": span.counters,
+            })
+
+    def to_chrome(self) -> dict:
+        """
+        :return: The spans as complete events of the Chrome trace format, in microseconds
+        """
+        events = [{"name": span["name"], "ph": "X", "ts": span["start"] * 1e6, "dur": span["duration"] * 1e6,
+                   "pid": span["pid"], "tid": span["tid"], "args": span["counters"]} for span in self.spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path, trace_format="json") -> None:
+        """
+        :param path: The output file
+        :param trace_format: json for a list of spans, chrome for the Chrome trace format
+        """
+        if trace_format not in ("json", "chrome"):
+            raise ValueError("Unknown trace format {}, expected json or chrome".format(trace_format))
+        trace = self.to_chrome() if trace_format == "chrome" else self.spans
+        with open(path, "w") as f:
+            json.dump(trace, f, indent=4, default=str)
+
+
+NULL_TRACER = Tracer(enabled=False)
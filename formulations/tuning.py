@@ -0,0 +1,175 @@
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .config import RunConfig
+from .solvers.schedules import SCHEDULES
+
+logger = logging.getLogger(__name__)
+
+
+def default_portfolio(solver="sa"):
+    """
+    :param solver: sa or psa for the simulated annealing parameters, qa for the QPU parameters
+    :return: A list of candidate configurations, each a dict of RunConfig parameters
+    """
+    if solver == "qa":
+        schedules = [{"annealing_time": annealing_time, "anneal_schedule_id": -1} for annealing_time in (20, 200)]
+        schedules += [{"anneal_schedule_id": schedule_id} for schedule_id in SCHEDULES]
+        return [dict(solver="qa", chain_strength_prefactor=prefactor, **schedule)
+                for prefactor in (0.1, 0.25, 0.5, 1.0) for schedule in schedules]
+    return [{"solver": solver, "num_sweeps": num_sweeps, "beta_range": beta_range}
+            for num_sweeps in (50, 100, 200, 500, 1000) for beta_range in (None, [0.1, 10.0], [1.0, 100.0])]
+
+
+def evaluate_candidate(job):
+    """
+    Solve one semiprime with one candidate configuration, in a worker process
+    :param job: A tuple of the formulation name, n, the RunConfig parameters, the number of reads and the output root
+    :return: The number of reads that factorized n, the number of reads and the wall time
+    """
+    from .batch import FORMULATIONS
+    formulation, n, parameters, num_reads, output_root = job
+    config = RunConfig(input_name=os.path.join("tuning", str(n)), num_reads=num_reads, output_root=output_root,
+                       **parameters)
+    model = FORMULATIONS[formulation]()
+    start = time.time()
+    model.solve(n, config=config)
+    return {"successes": model.stats["sol_pct"] * num_reads, "reads": num_reads, "time": time.time() - start}
+
+
+def successive_halving(ns, formulation="direct", portfolio=None, num_reads=100, eta=2, workers=None,
+                       output_root="output", base=None):
+    """
+    Run every candidate of the portfolio on the semiprimes concurrently, keep the best 1 / eta of them by successes
+    per read, and run the survivors again with eta times more reads, until one is left
+    :param ns: The semiprimes to tune on
+    :param formulation: The name of the formulation, see FORMULATIONS
+    :param portfolio: A list of candidate configurations, default_portfolio() when not given
+    :param num_reads: The number of reads of each candidate on each semiprime in the first round
+    :param eta: The reduction factor of each round
+    :param workers: The number of worker processes, defaults to the number of CPUs
+    :param output_root: The root directory of the results of the runs
+    :param base: RunConfig parameters shared by every candidate, such as {"qpu": "mock"}
+    :return: The candidates ranked by their last round, best first, with their accumulated counts
+    """
+    portfolio = portfolio if portfolio is not None else default_portfolio()
+    base = base if base is not None else {}
+    candidates = [{"config": config, "successes": 0, "reads": 0, "time": 0.0, "errors": 0, "rounds": 0}
+                  for config in portfolio]
+    survivors = list(range(len(candidates)))
+    reads = num_reads
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            futures = {}
+            for i in survivors:
+                parameters = dict(base, **candidates[i]["config"])
+                for n in ns:
+                    futures[executor.submit(evaluate_candidate, (formulation, n, parameters, reads, output_root))] = i
+            for i in survivors:
+                candidates[i]["rounds"] += 1
+            for future in as_completed(futures):
+                candidate = candidates[futures[future]]
+                try:
+                    result = future.result()
+                except Exception:
+                    candidate["errors"] += 1
+                    candidate["reads"] += reads
+                    continue
+                candidate["successes"] += result["successes"]
+                candidate["reads"] += result["reads"]
+                candidate["time"] += result["time"]
+
+            survivors.sort(key=lambda i: _score(candidates[i]), reverse=True)
+            if len(survivors) <= 1:
+                break
+            survivors = survivors[:max(1, math.ceil(len(survivors) / eta))]
+            reads *= eta
+    for candidate in candidates:
+        candidate["success_per_read"] = candidate["successes"] / candidate["reads"] if candidate["reads"] else 0.0
+    return sorted(candidates, key=lambda candidate: (candidate["rounds"], _score(candidate)), reverse=True)
+
+
+def tune(ns, formulation="direct", output="output/tuning.json", **options):
+    """
+    Tune the solver parameters for each bit length of the semiprimes separately and save the winners.
+    A bit length where no candidate factorized any semiprime is skipped, as its ranking only reflects speed.
+    :param ns: The semiprimes to tune on
+    :param formulation: The name of the formulation, see FORMULATIONS
+    :param output: The JSON file of the best configurations, updated in place
+    :param options: The options of successive_halving
+    :return: A dict mapping each bit length with a successful candidate to its best candidate
+    """
+    from .batch import FORMULATIONS
+    method = FORMULATIONS[formulation].method
+    by_bits = {}
+    for n in ns:
+        by_bits.setdefault(n.bit_length(), []).append(n)
+    best = {}
+    for bits, group in sorted(by_bits.items()):
+        ranking = successive_halving(group, formulation=formulation, **options)
+        if ranking[0]["successes"] == 0:
+            logger.warning("No candidate factorized a %d-bit semiprime, nothing saved for this bit length", bits)
+            continue
+        best[bits] = ranking[0]
+        save_tuning(output, method, bits, dict(ranking[0], num_semiprimes=len(group), num_candidates=len(ranking)))
+    return best
+
+
+def save_tuning(path, method, bits, entry) -> None:
+    """
+    Store the best configuration of a formulation for a bit length, replacing the file atomically
+    :param path: The JSON file of the best configurations
+    :param method: The method of the formulation, such as DI
+    :param bits: The bit length of n
+    :param entry: A dict holding the configuration under "config"
+    """
+    tuning = _read(path)
+    tuning.setdefault(method, {})[str(bits)] = entry
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(tuning, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def load_tuning(path, method, bits):
+    """
+    :return: The best configuration of a formulation for a bit length, or None
+    """
+    entry = _read(path).get(method, {}).get(str(bits))
+    return entry["config"] if entry is not None else None
+
+
+def apply_tuning(config, method, n):
+    """
+    Override the solver parameters of a run with the best configuration saved for the bit length of n
+    :param config: The RunConfig of the run, with config.tuning set
+    :param method: The method of the formulation
+    :param n: A safe semiprime
+    :return: The configuration applied, or None when there is none for this bit length
+    """
+    tuned = load_tuning(config.tuning, method, n.bit_length())
+    if tuned is not None:
+        for key, value in tuned.items():
+            setattr(config, key, value)
+    return tuned
+
+
+def _score(candidate):
+    rate = candidate["successes"] / candidate["reads"] if candidate["reads"] else 0.0
+    time_per_read = candidate["time"] / candidate["reads"] if candidate["reads"] else math.inf
+    return rate, -time_per_read
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
@@ -1,10 +1,51 @@
+import argparse
+import logging
 import os
 
-from formulations import DirectFormulation
+from formulations import RunConfig, factorize
+from formulations.batch import FORMULATIONS
+from formulations.quadratization import QUADRATIZATIONS
+from formulations.solvers import SOLVERS
 
-formulation = DirectFormulation()
-with open("dataset/.inp", "r") as f:
-    n = int(f.readline().strip())
-    os.environ["INPUT_FILE"] = ".inp"
-    ans = formulation.solve(n)
-    print(ans)
\ No newline at end of file
+
+def read_input(path):
+    """
+    :param path: A file of semiprimes, one per line
+    :return: The semiprimes of the non-empty lines
+    """
+    with open(path, "r") as f:
+        return [int(line.strip()) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Factorize semiprimes, given on the command line or in a file")
+    parser.add_argument("n", nargs="*", type=int, help="The semiprimes to factorize, read from --input when not given")
+    parser.add_argument("--input", default="dataset/.inp", help="A file of semiprimes, one per line")
+    parser.add_argument("--formulation", default="direct", choices=list(FORMULATIONS))
+    parser.add_argument("--quadratization", default=None, choices=list(QUADRATIZATIONS),
+                        help="The quadratization, the default of the formulation when not given")
+    parser.add_argument("--solver", default="qa", choices=list(SOLVERS), help="The solver backend")
+    parser.add_argument("--num-reads", type=int, default=1000)
+    parser.add_argument("--qpu", default="dwave", choices=["dwave", "mock"], help="The QPU of the qa solver")
+    parser.add_argument("--output-root", default="output", help="The root directory of the results")
+    parser.add_argument("--classical-budget", type=float, default=0.01,
+                        help="The seconds of classical factoring before annealing each semiprime")
+    parser.add_argument("--anneal-only", action="store_true", help="Skip the classical factoring")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level, format="%(message)s")
+    if args.n:
+        inputs = [(str(n), n) for n in args.n]
+    else:
+        input_name = os.path.basename(args.input)
+        inputs = [(input_name, n) for n in read_input(args.input)]
+    if args.quadratization is None:
+        formulation = FORMULATIONS[args.formulation]()
+    else:
+        formulation = FORMULATIONS[args.formulation](quadratization=args.quadratization)
+    for input_name, n in inputs:
+        config = RunConfig(input_name=input_name, solver=args.solver, num_reads=args.num_reads, qpu=args.qpu,
+                           output_root=args.output_root,
+                           classical_budget=None if args.anneal_only else args.classical_budget)
+        print(factorize(n, formulation, config=config))
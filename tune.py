@@ -0,0 +1,33 @@
+import argparse
+import json
+import random
+
+from formulations.batch import FORMULATIONS, read_semiprimes
+from formulations.classical import random_semiprime
+from formulations.tuning import default_portfolio, tune
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tune the solver parameters per bit length with successive halving")
+    parser.add_argument("path", nargs="?", help="A file or a directory of semiprimes, one per line")
+    parser.add_argument("--bits", type=int, nargs="+", default=[16], help="Bit lengths of random semiprimes")
+    parser.add_argument("--instances", type=int, default=4, help="The number of random semiprimes per bit length")
+    parser.add_argument("--output", default="output/tuning.json", help="The JSON file of the best configurations")
+    parser.add_argument("--formulation", default="direct", choices=list(FORMULATIONS))
+    parser.add_argument("--solver", default="sa", choices=["sa", "psa", "qa"])
+    parser.add_argument("--qpu", default="mock", choices=["mock", "dwave"], help="The QPU of the qa portfolio")
+    parser.add_argument("--num-reads", type=int, default=100, help="The reads of each candidate in the first round")
+    parser.add_argument("--eta", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.path is not None:
+        ns = [n for _, n in read_semiprimes(args.path)]
+    else:
+        rng = random.Random(args.seed)
+        ns = [random_semiprime(bits, rng) for bits in args.bits for _ in range(args.instances)]
+    base = {"qpu": args.qpu} if args.solver == "qa" else {}
+    best = tune(ns, formulation=args.formulation, output=args.output, portfolio=default_portfolio(args.solver),
+                num_reads=args.num_reads, eta=args.eta, workers=args.workers, base=base)
+    for bits, candidate in best.items():
+        print(bits, json.dumps(candidate["config"]), "{:.4f}".format(candidate["success_per_read"]))